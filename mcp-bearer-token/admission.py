@@ -0,0 +1,155 @@
+import asyncio
+import math
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from mcp import ErrorData, McpError
+from mcp.types import INTERNAL_ERROR
+
+from metrics import span
+
+COMIC_MAX_CONCURRENT = int(os.environ.get("COMIC_MAX_CONCURRENT", "2"))
+COMIC_MAX_QUEUE = int(os.environ.get("COMIC_MAX_QUEUE", "16"))
+COMIC_MAX_QUEUE_PER_CLIENT = int(os.environ.get("COMIC_MAX_QUEUE_PER_CLIENT", "8"))
+
+
+class AdmissionController:
+    """
+    Caps how many calls of a tool run at once and queues the rest.
+
+    Waiting calls are kept in one FIFO per client and served round-robin across
+    clients, so one busy token cannot starve the others. When the queue is full
+    new calls are rejected straight away with a retry-after hint, unless they are
+    admitted with reject=False (background work with its own cap), which always waits.
+
+    Args:
+        name (str): Tool name, used in error messages.
+        max_concurrent (int): Calls allowed to run at the same time.
+        max_queue (int): Calls allowed to wait in total.
+        max_queue_per_client (int): Calls a single client may have waiting.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, max_queue_per_client=None):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client or max_queue
+        self._running = 0
+        self._waiting = OrderedDict()  # client_id -> deque of futures, in round-robin order
+        self._queued = 0
+        self._avg_duration = 30.0  # seconds, refined as calls complete
+        self.admitted = 0
+        self.rejected = 0
+
+    def retry_after(self):
+        """Rough number of seconds until a queue slot frees up."""
+        backlog = self._queued + self._running + 1
+        return max(1, math.ceil(self._avg_duration * backlog / self.max_concurrent))
+
+    def _reject(self, reason):
+        self.rejected += 1
+        retry_after = self.retry_after()
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"{self.name} is busy ({reason}), retry after {retry_after}s",
+            data={"retry_after": retry_after},
+        ))
+
+    def check(self, client_id="anonymous"):
+        """
+        Raise the retry-after error now if a call from client_id would be rejected.
+
+        Call it before decoding uploads, so a call that cannot be queued costs no work.
+        """
+        if self._running < self.max_concurrent and not self._queued:
+            return
+        if self._queued >= self.max_queue:
+            self._reject("queue full")
+        if len(self._waiting.get(client_id, ())) >= self.max_queue_per_client:
+            self._reject("too many queued requests for this client")
+
+    async def _acquire(self, client_id, reject=True):
+        if self._running < self.max_concurrent and not self._queued:
+            self._running += 1
+            return
+
+        if reject:
+            self.check(client_id)
+        client_queue = self._waiting.setdefault(client_id, deque())
+
+        waiter = asyncio.get_running_loop().create_future()
+        client_queue.append(waiter)
+        self._queued += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we were cancelled: pass it on
+                self._release_slot()
+            else:
+                self._remove_waiter(client_id, waiter)
+            raise
+
+    def _remove_waiter(self, client_id, waiter):
+        client_queue = self._waiting.get(client_id)
+        if client_queue and waiter in client_queue:
+            client_queue.remove(waiter)
+            self._queued -= 1
+            if not client_queue:
+                del self._waiting[client_id]
+
+    def _release_slot(self):
+        self._running -= 1
+        # Hand the slot to the first waiter of the next client in rotation
+        while self._waiting:
+            client_id, client_queue = next(iter(self._waiting.items()))
+            waiter = client_queue.popleft()
+            self._queued -= 1
+            if client_queue:
+                self._waiting.move_to_end(client_id)
+            else:
+                del self._waiting[client_id]
+            if not waiter.done():
+                self._running += 1
+                waiter.set_result(None)
+                return
+
+    @asynccontextmanager
+    async def admit(self, client_id="anonymous", reject=True):
+        """Wait for a slot (or fail fast when the queue is full, if reject) and hold it for the block."""
+        with span("admission_wait"):
+            await self._acquire(client_id, reject)
+        self.admitted += 1
+        started = asyncio.get_running_loop().time()
+        try:
+            yield
+        finally:
+            duration = asyncio.get_running_loop().time() - started
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            self._release_slot()
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "queued": self._queued,
+            "clients_waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+def current_client_id():
+    """client_id of the bearer token on the current request, if any."""
+    from fastmcp.server.dependencies import get_access_token
+
+    access_token = get_access_token()
+    return access_token.client_id if access_token is not None else "anonymous"
+
+
+comic_admission = AdmissionController(
+    "generate_comic_strip_tool",
+    max_concurrent=COMIC_MAX_CONCURRENT,
+    max_queue=COMIC_MAX_QUEUE,
+    max_queue_per_client=COMIC_MAX_QUEUE_PER_CLIENT,
+)
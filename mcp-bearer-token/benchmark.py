@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the comic pipeline.
+
+Swaps the Gemini client for a stub that returns the fixture panels from
+Individual_Panels/ and a canned story after a configurable delay, then measures
+generate_comic_strip_tool throughput and latency percentiles at several
+concurrency levels, event-loop lag while requests are in flight, and the time
+of the local CPU stages (decode, layout, texture, encode).
+
+No Gemini key is needed:
+
+    python benchmark.py --concurrency 1,4,8 --requests 16 --image-latency 2 --story-latency 0.5
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import statistics
+import time
+from types import SimpleNamespace
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PANELS_DIR = os.path.join(BASE_DIR, "Individual_Panels")
+INPUT_IMAGE = os.path.join(BASE_DIR, "Test_Images", "Input.jpg")
+
+# mcp_starter refuses to import without these
+os.environ.setdefault("AUTH_TOKEN", "benchmark")
+os.environ.setdefault("MY_NUMBER", "910000000000")
+
+CANNED_STORY = {
+    "title": "The Benchmark Bandit",
+    "text1": "Our hero discovers the build is mysteriously fast today.",
+    "text2": "He suspects a cache, a pool, or possibly a friendly ghost.",
+    "text3": "Turns out it was just the stub backend all along!",
+}
+
+
+# --- Stub Gemini backend ---
+class FakeModels:
+    """Mimics client.models.generate_content / generate_content_stream with fixture data."""
+
+    def __init__(self, image_latency, story_latency):
+        self.image_latency = image_latency
+        self.story_latency = story_latency
+        self.panel_bytes = []
+        for i in range(1, 4):
+            with open(os.path.join(PANELS_DIR, f"comic_panel_{i}.png"), "rb") as f:
+                self.panel_bytes.append(f.read())
+
+    def _panel_part(self, data):
+        return SimpleNamespace(inline_data=SimpleNamespace(data=data, mime_type="image/png"), text=None)
+
+    def _response(self, parts, text=None):
+        content = SimpleNamespace(parts=parts)
+        return SimpleNamespace(candidates=[SimpleNamespace(content=content)], text=text)
+
+    def generate_content(self, model, contents, config=None):
+        if "image" in model:
+            time.sleep(self.image_latency)
+            return self._response([self._panel_part(data) for data in self.panel_bytes])
+        time.sleep(self.story_latency)
+        return self._response([], text=json.dumps(CANNED_STORY))
+
+    def generate_content_stream(self, model, contents, config=None):
+        for data in self.panel_bytes:
+            time.sleep(self.image_latency / len(self.panel_bytes))
+            yield self._response([self._panel_part(data)])
+
+
+class FakeGenaiClient:
+    def __init__(self, image_latency=0.0, story_latency=0.0):
+        self.models = FakeModels(image_latency, story_latency)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def time_stage(fn, iterations):
+    """Run fn `iterations` times and return the mean seconds per call."""
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations
+
+
+# --- Local CPU stages ---
+def benchmark_stages(iterations):
+    from PIL import Image
+    from encoding import encode_image, output_settings
+    from ingest import ingest_image
+    from layout_generation import render_comic_strip
+    from texture import apply_texture_to_image
+
+    with open(INPUT_IMAGE, "rb") as f:
+        input_b64 = base64.b64encode(f.read()).decode("utf-8")
+    panels = [Image.open(os.path.join(PANELS_DIR, f"comic_panel_{i}.png")).convert("RGB") for i in range(1, 4)]
+    strip = render_comic_strip(panels, CANNED_STORY)
+    final = apply_texture_to_image(strip)
+
+    def decode():
+        ingest_image(input_b64)
+
+    def encode():
+        data, _ = encode_image(final, **output_settings())
+        base64.b64encode(data)
+
+    return {
+        "base64 decode": time_stage(decode, iterations),
+        "layout": time_stage(lambda: render_comic_strip(panels, CANNED_STORY), iterations),
+        "texture": time_stage(lambda: apply_texture_to_image(strip), iterations),
+        "encode": time_stage(encode, iterations),
+    }
+
+
+# --- End-to-end load ---
+async def measure_loop_lag(stop, interval=0.01):
+    """Largest delay seen between when a 10ms sleep should wake up and when it does."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def run_level(tool, input_b64, concurrency, requests, run_id):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                # A distinct story guide per call keeps the result cache out of the measurement
+                await tool(puch_image_data=input_b64, story_guide=f"benchmark {run_id}-{i}")
+            except Exception as e:
+                failures += 1
+                print(f"request {i} failed: {e}")
+                return
+            latencies.append(time.perf_counter() - started)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    loop_lag = await lag_task
+
+    return {
+        "concurrency": concurrency,
+        "ok": len(latencies),
+        "failed": failures,
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) if latencies else float("nan"),
+        "p95": percentile(latencies, 95) if latencies else float("nan"),
+        "p99": percentile(latencies, 99) if latencies else float("nan"),
+        "mean": statistics.mean(latencies) if latencies else float("nan"),
+        "loop_lag": loop_lag,
+    }
+
+
+async def benchmark_tool(levels, requests, verbose):
+    import mcp_starter
+
+    tool = getattr(mcp_starter.generate_comic_strip_tool, "fn", mcp_starter.generate_comic_strip_tool)
+    with open(INPUT_IMAGE, "rb") as f:
+        input_b64 = base64.b64encode(f.read()).decode("utf-8")
+
+    results = []
+    for run_id, concurrency in enumerate(levels):
+        quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+        with quiet:
+            results.append(await run_level(tool, input_b64, concurrency, requests, run_id))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=8, help="requests per concurrency level")
+    parser.add_argument("--image-latency", type=float, default=1.0, help="stub panel generation delay (s)")
+    parser.add_argument("--story-latency", type=float, default=0.3, help="stub story generation delay (s)")
+    parser.add_argument("--gemini-rate", type=float, default=0,
+                        help="client-side Gemini rate limit in requests/min (default: unlimited)")
+    parser.add_argument("--stage-iterations", type=int, default=10, help="iterations per local stage")
+    parser.add_argument("--verbose", action="store_true", help="show the server's per-request output")
+    args = parser.parse_args()
+
+    import gemini_retry
+    from clients import set_genai_client
+    set_genai_client(FakeGenaiClient(args.image_latency, args.story_latency))
+    if args.gemini_rate:
+        gemini_retry.gemini_rate_limiter = gemini_retry.TokenBucket(args.gemini_rate / 60, gemini_retry.GEMINI_BURST)
+    else:
+        gemini_retry.gemini_rate_limiter = gemini_retry.TokenBucket(1e9, 1_000_000)
+
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        stages = benchmark_stages(args.stage_iterations)
+    print("Local stages (mean per call):")
+    for stage, seconds in stages.items():
+        print(f"  {stage:<14} {seconds * 1000:8.1f} ms")
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    print(f"\nEnd to end ({args.requests} requests per level, stub latency "
+          f"{args.image_latency}s image + {args.story_latency}s story):")
+    print(f"  {'conc':>4} {'ok':>4} {'fail':>4} {'req/s':>7} {'p50':>7} {'p95':>7} {'p99':>7} {'loop lag':>9}")
+    for r in asyncio.run(benchmark_tool(levels, args.requests, args.verbose)):
+        print(f"  {r['concurrency']:>4} {r['ok']:>4} {r['failed']:>4} {r['throughput']:>7.2f} "
+              f"{r['p50']:>6.2f}s {r['p95']:>6.2f}s {r['p99']:>6.2f}s {r['loop_lag'] * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
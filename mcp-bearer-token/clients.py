@@ -0,0 +1,75 @@
+import importlib.util
+import os
+import threading
+
+import httpx
+from dotenv import load_dotenv
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# HTTP/2 needs the optional `h2` package (pip install "httpx[http2]")
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+_lock = threading.Lock()
+_genai_client = None
+_http_client = None
+
+
+def pool_limits():
+    return httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_genai_client():
+    """Return the process-wide Gemini client, creating it on first use."""
+    global _genai_client
+    if _genai_client is None:
+        with _lock:
+            if _genai_client is None:
+                from google import genai
+                from google.genai import types
+
+                load_dotenv()
+                client_args = {"limits": pool_limits(), "http2": HTTP2_ENABLED}
+                _genai_client = genai.Client(
+                    api_key=os.getenv("GEMINI_API_KEY"),
+                    http_options=types.HttpOptions(
+                        client_args=client_args,
+                        async_client_args=client_args,
+                    ),
+                )
+    return _genai_client
+
+
+def set_genai_client(client):
+    """Replace the shared Gemini client, e.g. with a stub backend for benchmarks."""
+    global _genai_client
+    with _lock:
+        _genai_client = client
+
+
+def get_http_client():
+    """Return the shared keep-alive httpx.AsyncClient used for outgoing web requests."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(limits=pool_limits(), http2=HTTP2_ENABLED)
+    return _http_client
+
+
+async def close_clients():
+    """Close the shared clients. Called when the server shuts down."""
+    global _genai_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    if _genai_client is not None:
+        # Older google-genai releases have no close(); their pools close on garbage collection
+        close = getattr(_genai_client, "close", None)
+        if close is not None:
+            close()
+        _genai_client = None
@@ -0,0 +1,122 @@
+import io
+import os
+
+from PIL import Image
+
+OUTPUT_FORMAT = os.environ.get("COMIC_OUTPUT_FORMAT", "png").lower()
+OUTPUT_QUALITY = int(os.environ.get("COMIC_OUTPUT_QUALITY", "85"))
+OUTPUT_MAX_WIDTH = int(os.environ.get("COMIC_OUTPUT_MAX_WIDTH", "0"))  # 0 = keep full size
+OUTPUT_MAX_BYTES = int(os.environ.get("COMIC_OUTPUT_MAX_BYTES", "0"))  # 0 = no byte budget
+OUTPUT_PNG_COLORS = int(os.environ.get("COMIC_OUTPUT_PNG_COLORS", "0"))  # 0 = full colour PNG
+
+MIME_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+MIN_QUALITY = 30
+MIN_WIDTH = 320
+PALETTE_STEPS = (256, 128, 64, 32)
+
+
+def output_settings(output_format=None, max_bytes=None):
+    """Server defaults for encode_image, with optional per-call overrides."""
+    fmt = (output_format or OUTPUT_FORMAT).lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in MIME_TYPES:
+        raise ValueError(f"Unsupported output format {fmt!r}, expected one of {sorted(MIME_TYPES)}")
+    return {
+        "fmt": fmt,
+        "quality": OUTPUT_QUALITY,
+        "max_width": OUTPUT_MAX_WIDTH or None,
+        "max_bytes": max_bytes if max_bytes is not None else (OUTPUT_MAX_BYTES or None),
+        "palette_colors": OUTPUT_PNG_COLORS or None,
+    }
+
+
+def _save(image, fmt, quality=None, palette_colors=None):
+    buf = io.BytesIO()
+    if fmt == "png":
+        if palette_colors:
+            image = image.quantize(colors=palette_colors, method=Image.Quantize.MEDIANCUT)
+            image.save(buf, format="PNG", optimize=True)
+        else:
+            image.save(buf, format="PNG")
+    elif fmt == "webp":
+        image.save(buf, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buf, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def _fit_quality(image, fmt, quality, max_bytes):
+    """Highest quality in [MIN_QUALITY, quality] whose output fits max_bytes (binary search)."""
+    data = _save(image, fmt, quality=quality)
+    if len(data) <= max_bytes:
+        return data
+    best = None
+    low, high = MIN_QUALITY, quality - 1
+    while low <= high:
+        mid = (low + high) // 2
+        candidate = _save(image, fmt, quality=mid)
+        if len(candidate) <= max_bytes:
+            best, low = candidate, mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+def _palette_steps(palette_colors):
+    """Palette sizes to try, largest first: full colour (None) or the requested count, then smaller steps."""
+    if not palette_colors:
+        return [None, *PALETTE_STEPS]
+    return [palette_colors, *(c for c in PALETTE_STEPS if c < palette_colors)]
+
+
+def _fit_palette(image, palette_colors, max_bytes):
+    """Full colour PNG first, then fewer and fewer palette colours until it fits max_bytes."""
+    steps = _palette_steps(palette_colors)
+    for colors in steps:
+        data = _save(image, "png", palette_colors=colors)
+        if len(data) <= max_bytes:
+            return data
+    return None
+
+
+def encode_image(image, fmt="png", quality=OUTPUT_QUALITY, max_width=None, max_bytes=None, palette_colors=None):
+    """
+    Encode the final comic once, straight from the in-memory composite.
+
+    Args:
+        image (PIL.Image): The finished comic strip.
+        fmt (str): "png", "webp" or "jpeg".
+        quality (int): Starting quality for WebP/JPEG.
+        max_width (int): Downscale to at most this width first, keeping the aspect ratio.
+        max_bytes (int): Byte budget. Quality (or PNG palette size) is lowered, then the
+            image downscaled, until the output fits. The smallest attempt is returned if
+            nothing fits.
+        palette_colors (int): Quantize PNG output to this many colours.
+
+    Returns:
+        tuple: (encoded bytes, MIME type)
+    """
+    image = image.convert("RGB")
+    if max_width and image.width > max_width:
+        image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+    if not max_bytes:
+        if fmt == "png":
+            return _save(image, fmt, palette_colors=palette_colors), MIME_TYPES[fmt]
+        return _save(image, fmt, quality=quality), MIME_TYPES[fmt]
+
+    while True:
+        if fmt == "png":
+            data = _fit_palette(image, palette_colors, max_bytes)
+        else:
+            data = _fit_quality(image, fmt, quality, max_bytes)
+        if data is not None:
+            return data, MIME_TYPES[fmt]
+        if image.width <= MIN_WIDTH:
+            # Nothing fits: return the smallest encoding we can make
+            if fmt == "png":
+                return _save(image, fmt, palette_colors=_palette_steps(palette_colors)[-1]), MIME_TYPES[fmt]
+            return _save(image, fmt, quality=MIN_QUALITY), MIME_TYPES[fmt]
+        width = max(MIN_WIDTH, round(image.width * 0.8))
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+FETCH_CACHE_MAX_ENTRIES = int(os.environ.get("FETCH_CACHE_MAX_ENTRIES", "256"))
+FETCH_CACHE_MAX_MB = int(os.environ.get("FETCH_CACHE_MAX_MB", "64"))
+FETCH_CACHE_HEURISTIC_MAX_S = int(os.environ.get("FETCH_CACHE_HEURISTIC_MAX_S", "3600"))
+MARKDOWN_CACHE_MAX_ENTRIES = int(os.environ.get("FETCH_MARKDOWN_CACHE_ENTRIES", "256"))
+
+
+def parse_cache_control(value):
+    """Cache-Control header as a dict of lower-cased directive -> argument ('' when it has none)."""
+    directives = {}
+    for item in (value or "").split(","):
+        name, _, arg = item.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"')
+    return directives
+
+
+def _http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp() if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers, now):
+    """
+    Seconds a response may be served without revalidation, following RFC 9111:
+    s-maxage / max-age, then Expires, then 10% of the time since Last-Modified
+    (capped at FETCH_CACHE_HEURISTIC_MAX_S). Returns None if it must not be stored.
+    """
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-store" in directives or "private" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    for name in ("s-maxage", "max-age"):
+        if name in directives:
+            try:
+                age = int(headers.get("age", "0") or 0)
+                return max(0, int(directives[name]) - age)
+            except ValueError:
+                return 0
+
+    date = _http_date(headers.get("date")) or now
+    expires = headers.get("expires")
+    if expires is not None:
+        expires_at = _http_date(expires)
+        return max(0, expires_at - date) if expires_at else 0
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None:
+        return min(FETCH_CACHE_HEURISTIC_MAX_S, max(0, (date - last_modified) / 10))
+    return 0
+
+
+class CachedPage:
+    """A fetched page body plus what is needed to reuse or revalidate it."""
+
+    def __init__(self, text, content_type, etag, last_modified, expires_at, truncated_at=None):
+        self.text = text
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+        self.truncated_at = truncated_at  # byte limit the body was cut off at, None if complete
+
+    @property
+    def size(self):
+        return len(self.text)
+
+    def clipped(self, max_bytes):
+        """
+        The text cut to at most max_bytes of UTF-8, for callers with a smaller limit than
+        the one it was fetched with. Returns (text, byte limit it was cut at or None).
+        """
+        if len(self.text) * 4 > max_bytes:  # cannot be over max_bytes otherwise
+            encoded = self.text.encode("utf-8")
+            if len(encoded) > max_bytes:
+                return encoded[:max_bytes].decode("utf-8", "ignore"), max_bytes
+        return self.text, self.truncated_at
+
+    def is_fresh(self, now=None):
+        return (now or time.time()) < self.expires_at
+
+    def validators(self):
+        """Conditional request headers for revalidating this page."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class FetchCache:
+    """
+    HTTP-aware LRU of fetched pages, keyed by URL.
+
+    Fresh pages are served without touching the network; stale pages that carry
+    an ETag or Last-Modified are revalidated with a conditional request, and a
+    304 refreshes them in place. Used from the event loop only.
+
+    Args:
+        max_entries (int): Maximum pages kept.
+        max_bytes (int): Maximum total size of the kept page bodies.
+    """
+
+    def __init__(self, max_entries=FETCH_CACHE_MAX_ENTRIES, max_bytes=FETCH_CACHE_MAX_MB * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def get(self, url, max_bytes=None):
+        """
+        Cached page for url, fresh or stale, or None.
+
+        A page that was cut off at fewer than max_bytes is not returned, so a caller
+        allowing a larger body fetches it again instead of getting the shorter one.
+        """
+        page = self._pages.get(url)
+        if page is not None and page.truncated_at is not None and max_bytes is not None and page.truncated_at < max_bytes:
+            return None
+        if page is not None:
+            self._pages.move_to_end(url)
+            if page.is_fresh():
+                self.hits += 1
+        return page
+
+    def store(self, url, response, text, truncated_at=None):
+        """Keep a 200 response if its headers allow it. Returns the CachedPage, or None."""
+        self.misses += 1
+        self._discard(url)
+        if response.status_code != 200:
+            return None
+        now = time.time()
+        lifetime = freshness_lifetime(response.headers, now)
+        etag = response.headers.get("etag")
+        last_modified = response.headers.get("last-modified")
+        if lifetime is None or (lifetime <= 0 and not etag and not last_modified):
+            return None
+        page = CachedPage(text, response.headers.get("content-type", ""), etag, last_modified, now + lifetime, truncated_at)
+        if page.size > self.max_bytes:
+            return None
+        self._pages[url] = page
+        self._bytes += page.size
+        while len(self._pages) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._pages.popitem(last=False)
+            self._bytes -= evicted.size
+        return page
+
+    def refresh(self, url, page, response):
+        """Apply the headers of a 304 Not Modified to a stale page."""
+        self.revalidated += 1
+        lifetime = freshness_lifetime(response.headers, time.time())
+        if lifetime is None:
+            self._discard(url)
+            return
+        page.expires_at = time.time() + lifetime
+        page.etag = response.headers.get("etag", page.etag)
+        page.last_modified = response.headers.get("last-modified", page.last_modified)
+
+    def _discard(self, url):
+        page = self._pages.pop(url, None)
+        if page is not None:
+            self._bytes -= page.size
+
+    def stats(self):
+        return {
+            "entries": len(self._pages),
+            "mb": round(self._bytes / (1024 * 1024), 1),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+        }
+
+
+class MarkdownCache:
+    """LRU of extracted markdown keyed by a hash of the page HTML and extraction mode."""
+
+    def __init__(self, max_entries=MARKDOWN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(html, mode):
+        return hashlib.sha256(f"{mode}\0{html}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            markdown = self._entries.get(key)
+            if markdown is not None:
+                self._entries.move_to_end(key)
+            return markdown
+
+    def put(self, key, markdown):
+        with self._lock:
+            self._entries[key] = markdown
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+fetch_cache = FetchCache()
+markdown_cache = MarkdownCache()
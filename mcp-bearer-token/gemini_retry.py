@@ -0,0 +1,100 @@
+import os
+import random
+import threading
+import time
+
+import httpx
+
+GEMINI_RATE_PER_MIN = float(os.environ.get("GEMINI_RATE_PER_MIN", "60"))
+GEMINI_BURST = int(os.environ.get("GEMINI_BURST", "5"))
+GEMINI_MAX_ATTEMPTS = int(os.environ.get("GEMINI_MAX_ATTEMPTS", "4"))
+BACKOFF_BASE = 1.0  # seconds
+BACKOFF_CAP = 20.0  # seconds
+
+
+class DeadlineExceeded(TimeoutError):
+    """The tool call's deadline passed before the Gemini call could finish."""
+
+
+class IncompleteResponse(Exception):
+    """Gemini answered, but with less than we asked for (e.g. missing panels). Worth retrying."""
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter shared by all Gemini calls in the process.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (int): Maximum burst size.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline=None):
+        """Block until a token is available, or raise DeadlineExceeded."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                raise DeadlineExceeded("Deadline reached while waiting for the Gemini rate limit")
+            time.sleep(wait)
+
+
+gemini_rate_limiter = TokenBucket(GEMINI_RATE_PER_MIN / 60, GEMINI_BURST)
+
+
+def is_retryable(exc):
+    """429s, 5xx responses, transport errors and incomplete responses are retried."""
+    from google.genai import errors
+
+    if isinstance(exc, errors.APIError):
+        return exc.code == 429 or (exc.code or 0) >= 500
+    return isinstance(exc, (IncompleteResponse, httpx.TransportError))
+
+
+def remaining_ms(deadline):
+    """Milliseconds left until the deadline, for per-request HTTP timeouts (None = no deadline)."""
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline reached before the Gemini call started")
+    return int(remaining * 1000)
+
+
+def call_with_retry(fn, *args, deadline=None, max_attempts=GEMINI_MAX_ATTEMPTS, **kwargs):
+    """
+    Call fn(*args, **kwargs) under the shared rate limit, retrying retryable errors
+    with jittered exponential backoff until max_attempts or the deadline.
+
+    Args:
+        deadline (float): time.monotonic() value by which the call must finish, or None.
+        max_attempts (int): Total attempts, including the first.
+    """
+    for attempt in range(1, max_attempts + 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded("Deadline reached before the Gemini call started")
+        gemini_rate_limiter.acquire(deadline)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_attempts or not is_retryable(e):
+                raise
+            # Full jitter: sleep anywhere between 0 and the capped exponential delay
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** (attempt - 1)))
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise
+            print(f"Gemini call failed ({e}), retrying in {delay:.1f}s (attempt {attempt}/{max_attempts})")
+            time.sleep(delay)
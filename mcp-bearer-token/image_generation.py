@@ -1,19 +1,72 @@
-from google import genai
 from google.genai import types
 from PIL import Image
 from io import BytesIO
-from dotenv import load_dotenv
+from clients import get_genai_client
+from gemini_retry import IncompleteResponse, call_with_retry, remaining_ms
+from text_generation import STORY_FORMAT_PROMPT, find_story_json
 import os
 
-def generate_comic_panels(story_guide,base_image_path, reference_style_path, output_dir="Individual_Panels"):
-    # Load environment and Gemini API key
-    load_dotenv()
-    KEY = os.getenv("GEMINI_API_KEY")
-    client = genai.Client(api_key=KEY)
+PANEL_COUNT = 3
+
+
+def generate_comic_panel_images(story_guide, base_image, reference_style, on_panel=None, deadline=None):
+    """
+    Generate comic panels from in-memory images.
+
+    Failed or incomplete Gemini responses are retried through gemini_retry; a retry
+    only asks for the panels that are still missing.
+
+    Args:
+        story_guide (str): Story guidance from the user.
+        base_image (PIL.Image): Image of the character.
+        reference_style (PIL.Image | types.Part): Comic style reference, as an image or a
+            prepared content part (see style_registry.ComicStyle.part).
+        on_panel (callable): Optional on_panel(panel_number, image_bytes, mime_type) callback.
+            When given, the response is streamed and the callback fires as each panel arrives.
+        deadline (float): Optional time.monotonic() deadline for the whole generation.
+
+    Returns:
+        list: Generated panels as PIL images, in order. May hold fewer than 3 panels
+        if Gemini never returned them all.
+    """
+    panels, _ = _generate_panels(story_guide, base_image, reference_style, on_panel, deadline)
+    return panels
+
+
+def generate_comic_panels_and_story(story_guide, base_image, reference_style, name, on_panel=None, deadline=None):
+    """
+    Generate comic panels and their title and captions in a single Gemini call.
+
+    The image model is also asked for the story JSON, which is read from the text parts
+    of the same response. Image output cannot be schema-constrained, so the story is
+    None when the text holds no usable JSON; callers then fall back to
+    text_generation.generate_comic_story_from_images.
+
+    Args:
+        name (str): The character's name, used in the captions.
+        Others as for generate_comic_panel_images.
+
+    Returns:
+        tuple: (panels as PIL images, story dict with 'title' and 'text1'..'text3', or None)
+    """
+    captions_prompt = (
+        "\nAfter the three images, also write the comic's title and one caption per panel. "
+        + STORY_FORMAT_PROMPT + f"The character's name is {name}"
+    )
+    panels, text = _generate_panels(story_guide, base_image, reference_style, on_panel, deadline, captions_prompt)
+    return panels, find_story_json(text)
+
+
+def _generate_panels(story_guide, base_image, reference_style, on_panel=None, deadline=None, extra_prompt=""):
+    """
+    Request the panels, retrying for missing ones, with extra_prompt appended to the prompt.
+    Arguments as for generate_comic_panel_images.
+
+    Returns:
+        tuple: (panels as PIL images, the text parts of all responses, joined)
+    """
+    client = get_genai_client()
 
-    # Load images
-    base_image = Image.open(base_image_path)
-    reference_style = Image.open(reference_style_path)
     # Prompt
     text_input = """
     Turn this into 3 square comic style images as in the reference comic image.
@@ -24,29 +77,76 @@ def generate_comic_panels(story_guide,base_image_path, reference_style_path, out
     THE STYLE MUST BE ALWAYS CONSISTENT IN ALL THREE IMAGES, THE OUTPUT IMAGE SHOULD ALWAYS BE IN 1:1 OR SQUARE ASPECT RATIO
 
     CARTOON STYLE IMAGES ONLY IN OUTPUT, NO TEXT BUBBLE IN THE IMAGE
-    """+ f"Story Guidance from User is {story_guide} (Ignore if empty)"
-
-    # Generate content
-    response = client.models.generate_content(
-        model="gemini-2.0-flash-exp-image-generation",
-        contents=[text_input, base_image, reference_style],
-        config=types.GenerateContentConfig(
-            response_modalities=['TEXT', 'IMAGE']
+    """+ f"Story Guidance from User is {story_guide} (Ignore if empty)" + extra_prompt
+
+    panels = []
+    texts = []  # streamed text may be split mid-word, so parts are joined without separators
+
+    def request_missing_panels():
+        # Generate content
+        contents = [text_input, base_image, reference_style]
+        if panels:
+            contents += [
+                f"Panels 1 to {len(panels)} are already drawn and attached below. "
+                f"Generate ONLY the remaining {PANEL_COUNT - len(panels)} panel(s), continuing the same story and style.",
+                *panels,
+            ]
+        config = types.GenerateContentConfig(
+            response_modalities=['TEXT', 'IMAGE'],
+            http_options=types.HttpOptions(timeout=remaining_ms(deadline)),
         )
-    )
+        if on_panel is None:
+            responses = [client.models.generate_content(
+                model="gemini-2.0-flash-exp-image-generation",
+                contents=contents,
+                config=config,
+            )]
+        else:
+            responses = client.models.generate_content_stream(
+                model="gemini-2.0-flash-exp-image-generation",
+                contents=contents,
+                config=config,
+            )
+
+        # Collect comic panels
+        for response in responses:
+            if not response.candidates or response.candidates[0].content is None:
+                continue
+            for part in response.candidates[0].content.parts or []:
+                if part.inline_data is not None and len(panels) < PANEL_COUNT:
+                    panels.append(Image.open(BytesIO(part.inline_data.data)))
+                    if on_panel is not None:
+                        on_panel(len(panels), part.inline_data.data, part.inline_data.mime_type)
+                elif part.text is not None:
+                    texts.append(part.text)
+
+        if len(panels) < PANEL_COUNT:
+            raise IncompleteResponse(f"Gemini returned {len(panels)} of {PANEL_COUNT} comic panels")
+
+    try:
+        call_with_retry(request_missing_panels, deadline=deadline)
+    except IncompleteResponse as e:
+        print(e)
+
+    text = "".join(texts)
+    if text and not extra_prompt:
+        print("Text response:", text)
+    return panels, text
+
+
+def generate_comic_panels(story_guide,base_image_path, reference_style_path, output_dir="Individual_Panels"):
+    # Load images
+    base_image = Image.open(base_image_path)
+    reference_style = Image.open(reference_style_path)
+
+    panels = generate_comic_panel_images(story_guide, base_image, reference_style)
 
     # Ensure output directory exists
     os.makedirs(output_dir, exist_ok=True)
 
     # Save comic panels
-    image_count = 0
-    for part in response.candidates[0].content.parts:
-        if part.inline_data is not None:
-            image = Image.open(BytesIO(part.inline_data.data))
-            image_count += 1
-            image.save(os.path.join(output_dir, f"comic_panel_{image_count}.png"))
-        elif part.text is not None:
-            print("Text response:", part.text)
-
-    print(f"{image_count} comic panels saved to '{output_dir}'.")
+    for image_count, image in enumerate(panels, start=1):
+        image.save(os.path.join(output_dir, f"comic_panel_{image_count}.png"))
 
+    print(f"{len(panels)} comic panels saved to '{output_dir}'.")
+    return panels
@@ -0,0 +1,109 @@
+import binascii
+import io
+import os
+import re
+
+from PIL import Image
+from mcp import ErrorData, McpError
+from mcp.types import INVALID_PARAMS
+
+INPUT_MAX_MB = float(os.environ.get("COMIC_INPUT_MAX_MB", "15"))  # decoded upload size
+INPUT_MAX_PIXELS = int(os.environ.get("COMIC_INPUT_MAX_PIXELS", str(50_000_000)))
+INPUT_MAX_SIDE = int(os.environ.get("COMIC_INPUT_MAX_SIDE", "1536"))  # long side after normalizing
+
+CHUNK_CHARS = 4 * 64 * 1024  # base64 characters decoded per step, a multiple of 4
+
+
+def _invalid(message):
+    raise McpError(ErrorData(code=INVALID_PARAMS, message=message))
+
+
+def decode_base64(data, max_bytes=int(INPUT_MAX_MB * 1024 * 1024), name="image"):
+    """
+    Decode a base64 payload chunk by chunk, refusing it before decoding if it is too large.
+
+    Accepts an optional "data:<mime>;base64," prefix and embedded line breaks.
+
+    Args:
+        data (str): The base64 string.
+        max_bytes (int): Largest decoded size accepted.
+        name (str): Parameter name used in error messages.
+
+    Returns:
+        bytes: The decoded payload.
+    """
+    if data.startswith("data:"):
+        header, _, data = data.partition(",")
+        if not header.endswith(";base64"):
+            _invalid(f"{name} must be base64-encoded")
+    if re.search(r"\s", data):
+        data = "".join(data.split())
+
+    # Every 4 characters carry 3 bytes, so the decoded size is known up front
+    decoded_size = len(data) // 4 * 3 - data[-2:].count("=")
+    if decoded_size > max_bytes:
+        _invalid(f"{name} is too large ({decoded_size / 1024 / 1024:.1f} MB, limit {max_bytes / 1024 / 1024:.1f} MB)")
+    if not data or len(data) % 4:
+        _invalid(f"{name} is not valid base64")
+
+    out = bytearray()
+    try:
+        for start in range(0, len(data), CHUNK_CHARS):
+            out += binascii.a2b_base64(data[start:start + CHUNK_CHARS], strict_mode=True)
+    except (binascii.Error, ValueError):
+        _invalid(f"{name} is not valid base64")
+    return bytes(out)
+
+
+def open_image(source, max_side=INPUT_MAX_SIDE, max_pixels=INPUT_MAX_PIXELS, name="image"):
+    """
+    Open an image and normalize it to at most max_side pixels on its long side.
+
+    The pixel count is checked from the header before anything is decoded. JPEGs are
+    decoded straight at a reduced scale with Image.draft; other formats are shrunk
+    with Image.reduce before the final resample.
+
+    Args:
+        source (bytes | str): Encoded image bytes or a file path.
+        max_side (int): Longest side of the returned image.
+        max_pixels (int): Largest width * height accepted.
+        name (str): Parameter name used in error messages.
+
+    Returns:
+        PIL.Image: The decoded RGB or RGBA image.
+    """
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    except (OSError, Image.DecompressionBombError):
+        _invalid(f"{name} is not a supported image")
+
+    width, height = image.size
+    if width * height > max_pixels:
+        _invalid(f"{name} is too large ({width}x{height}, limit {max_pixels / 1_000_000:.0f} MP)")
+
+    target = (max_side, max_side)
+    if image.format == "JPEG" and max(width, height) > max_side:
+        # Let libjpeg scale by 1/2, 1/4 or 1/8 while decoding
+        image.draft("RGB", target)
+    try:
+        image.load()
+    except OSError:
+        _invalid(f"{name} could not be decoded")
+
+    # Normalize the mode first: reduce() rejects palette, 1-bit and 16-bit images
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = image.mode in ("LA", "PA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+    factor = max(image.size) // max_side
+    if factor >= 2:
+        image = image.reduce(factor)
+    if max(image.size) > max_side:
+        image.thumbnail(target, Image.LANCZOS)
+    return image
+
+
+def ingest_image(data, name="image"):
+    """Decode a base64 upload into a size-capped image. Returns (decoded bytes, image)."""
+    image_bytes = decode_base64(data, name=name)
+    return image_bytes, open_image(image_bytes, name=name)
@@ -0,0 +1,168 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+JOBS_DB = os.environ.get("COMIC_JOBS_DB", os.path.join(BASE_DIR, "comic_jobs.db"))
+JOB_TTL = int(os.environ.get("COMIC_JOB_TTL", str(24 * 3600)))  # how long finished jobs are kept
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+UNFINISHED = (QUEUED, RUNNING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    client_id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    stage TEXT,
+    stages TEXT NOT NULL,       -- JSON {stage message: unix time}
+    params TEXT NOT NULL,       -- JSON generation parameters
+    input_image BLOB,           -- decoded base image, dropped once the job finishes
+    style_image BLOB,           -- decoded uploaded style reference, if any
+    story TEXT,                 -- JSON story of a succeeded job
+    result BLOB,
+    mime_type TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at);
+"""
+
+STATUS_COLUMNS = "id, client_id, state, stage, stages, error, attempts, created_at, updated_at, finished_at"
+
+
+class JobStore:
+    """
+    Durable comic jobs in a local SQLite database.
+
+    A job keeps its inputs until it finishes, so a job that was queued or running when
+    the server stopped can be started again, and the encoded result afterwards, so a
+    client that lost its connection can still collect it. Finished jobs are deleted
+    JOB_TTL seconds after they finish. Methods block; call them from a worker thread.
+
+    Args:
+        path (str): SQLite database file.
+        ttl (int): Seconds a finished job is kept.
+    """
+
+    def __init__(self, path=JOBS_DB, ttl=JOB_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def create(self, client_id, params, input_image, style_image=None):
+        """Store a new queued job. Returns its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO jobs (id, client_id, state, stage, stages, params, input_image, style_image, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, client_id, QUEUED, QUEUED, json.dumps({QUEUED: now}), json.dumps(params),
+                 input_image, style_image, now, now),
+            )
+        return job_id
+
+    def status(self, job_id):
+        """Job state without any blobs, as a dict, or None if unknown or expired."""
+        with self._lock:
+            row = self._db().execute(f"SELECT {STATUS_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        status = dict(row)
+        status["stages"] = json.loads(status["stages"])
+        return status
+
+    def inputs(self, job_id):
+        """(params, input image bytes, style image bytes or None) of an unfinished job."""
+        with self._lock:
+            row = self._db().execute(
+                "SELECT params, input_image, style_image FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return json.loads(row["params"]), row["input_image"], row["style_image"]
+
+    def result(self, job_id):
+        """(story dict, encoded image, MIME type) of a succeeded job."""
+        with self._lock:
+            row = self._db().execute("SELECT story, result, mime_type FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["story"]), row["result"], row["mime_type"]
+
+    def unfinished(self):
+        """Ids of jobs that are queued or were running, oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT id FROM jobs WHERE state IN (?, ?) ORDER BY created_at", UNFINISHED
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def _update(self, job_id, stage, **columns):
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            stages = json.loads(row["stages"])
+            stages[stage] = now
+            columns.update(stage=stage, stages=json.dumps(stages), updated_at=now)
+            assignments = ", ".join(f"{name} = ?" for name in columns)
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+    def start(self, job_id):
+        """Mark a job running. Returns how many times it has been started, this time included."""
+        with self._lock:
+            self._db().execute("UPDATE jobs SET attempts = attempts + 1 WHERE id = ?", (job_id,))
+        self._update(job_id, RUNNING, state=RUNNING)
+        return self.status(job_id)["attempts"]
+
+    def record_stage(self, job_id, stage):
+        self._update(job_id, stage)
+
+    def succeed(self, job_id, story, image, mime_type):
+        self._update(job_id, SUCCEEDED, state=SUCCEEDED, story=json.dumps(story), result=image,
+                     mime_type=mime_type, finished_at=time.time(), input_image=None, style_image=None)
+
+    def fail(self, job_id, error):
+        self._update(job_id, FAILED, state=FAILED, error=error, finished_at=time.time(),
+                     input_image=None, style_image=None)
+
+    def purge_expired(self):
+        """Delete jobs that finished more than ttl seconds ago. Returns how many were deleted."""
+        with self._lock:
+            cursor = self._db().execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl,))
+        return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            rows = self._db().execute("SELECT state, COUNT(*) AS n FROM jobs GROUP BY state").fetchall()
+        return {row["state"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+job_store = JobStore()
@@ -1,11 +1,154 @@
-from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from PIL import Image, ImageDraw
+from functools import lru_cache
+import math
 import os
 
+from text_layout import fit_text, font_metrics
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 font_title_path = os.path.join(BASE_DIR, "Fonts", "Some_Time_Later.otf")
 font_text_path =os.path.join(BASE_DIR, "Fonts", "digistrip.ttf")
 base_image_path =os.path.join(BASE_DIR, "Defaults","baseimage.png")
+
+ARRANGEMENTS = ("row", "grid", "vertical")
+CAPTION_TOP = 10  # gap between a panel and its caption
+CAPTION_MARGIN = 8  # space kept between a caption and its border
+LINE_SPACING = 5
+
+
+class LayoutTemplate:
+    """
+    Precomputed comic strip layout: fonts, background canvas, panel rectangles and borders.
+
+    Build it once and call render() per strip; rendering only copies the cached canvas
+    and pastes panels and text.
+
+    Args:
+        panel_count (int): Number of panels in the strip.
+        arrangement (str): "row" (side by side), "grid" or "vertical".
+        columns (int): Columns for the grid arrangement (default: square-ish grid).
+        panel_size (int): Width and height of each square panel in pixels.
+        padding (int): Space between panels and around the edges.
+        title_height (int): Height reserved for the title.
+        text_box_height (int): Height of the caption box under each panel.
+        title_font_size (int): Largest title font size; long titles are set smaller to fit.
+        text_font_size (int): Largest caption font size; long captions are set smaller to fit.
+        min_title_font_size (int): Smallest title font size before the title is cut short.
+        min_text_font_size (int): Smallest caption font size before a caption is cut short.
+        base_image_path (str): Optional path to a background image to use as the comic canvas.
+        font_title_path (str): Path to the title font file.
+        font_text_path (str): Path to the text font file.
+    """
+
+    def __init__(self, panel_count=3, arrangement="row", columns=None, panel_size=300, padding=20,
+                 title_height=80, text_box_height=100, title_font_size=50, text_font_size=14,
+                 min_title_font_size=20, min_text_font_size=8, base_image_path=base_image_path,
+                 font_title_path=font_title_path, font_text_path=font_text_path):
+        if arrangement not in ARRANGEMENTS:
+            raise ValueError(f"Unknown arrangement {arrangement!r}, expected one of {ARRANGEMENTS}")
+        if panel_count < 1:
+            raise ValueError("A comic strip needs at least one panel.")
+
+        if arrangement == "row":
+            columns = panel_count
+        elif arrangement == "vertical":
+            columns = 1
+        else:
+            columns = columns or math.ceil(math.sqrt(panel_count))
+        rows = math.ceil(panel_count / columns)
+
+        self.panel_count = panel_count
+        self.panel_size = panel_size
+        self.padding = padding
+        self.title_height = title_height
+        self.text_box_height = text_box_height
+        self.font_title_path = font_title_path
+        self.font_text_path = font_text_path
+        self.title_font_sizes = (title_font_size, min_title_font_size)
+        self.text_font_sizes = (text_font_size, min_text_font_size)
+
+        # Load the fonts at their preferred sizes up front
+        font_metrics(font_title_path, title_font_size)
+        font_metrics(font_text_path, text_font_size)
+
+        width = panel_size * columns + padding * (columns + 1)
+        height = title_height + rows * (panel_size + text_box_height) + padding * (rows + 2)
+        self.size = (width, height)
+
+        # Top-left corner of every panel image
+        self.panel_origins = []
+        for i in range(panel_count):
+            row, col = divmod(i, columns)
+            x = padding + col * (panel_size + padding)
+            y = title_height + padding + row * (panel_size + text_box_height + padding)
+            self.panel_origins.append((x, y))
+
+        # Load base image or create a white canvas
+        if base_image_path and os.path.exists(base_image_path):
+            canvas = Image.open(base_image_path).convert("RGB")
+            canvas = canvas.resize(self.size)
+        else:
+            canvas = Image.new("RGB", self.size, color="white")
+
+        # Borders sit just outside the panel and caption area, so they can be drawn up front
+        draw = ImageDraw.Draw(canvas)
+        for x, y in self.panel_origins:
+            draw.rectangle([x - 2, y - 2, x + panel_size + 2, y + panel_size + text_box_height],
+                           outline="black", width=2)
+        self.canvas = canvas
+
+    def prepare_panels(self, images):
+        """Resize panel images to the template's panel size, ahead of render()."""
+        size = (self.panel_size, self.panel_size)
+        return [image if image.size == size else image.resize(size) for image in images]
+
+    def render(self, images, story_dict):
+        """
+        Compose a strip from panel images and a story dictionary with 'title' and 'text1'..'textN'.
+
+        Returns:
+            PIL.Image: The composed comic strip.
+        """
+        if len(images) != self.panel_count:
+            raise ValueError(f"Expected {self.panel_count} panel images, got {len(images)}.")
+
+        images = self.prepare_panels(images)
+        canvas = self.canvas.copy()
+        draw = ImageDraw.Draw(canvas)
+
+        # Draw title centered, in the largest size that fits above the panels
+        title_width = self.size[0] - 2 * self.padding
+        title = fit_text(story_dict["title"], self.font_title_path, title_width, self.title_height - CAPTION_MARGIN,
+                         *self.title_font_sizes, spacing=LINE_SPACING)
+        title.draw(draw, self.padding, self.padding, title_width)
+
+        caption_width = self.panel_size - 2 * CAPTION_MARGIN
+        caption_height = self.text_box_height - CAPTION_TOP - CAPTION_MARGIN
+        for i, (x, y_img) in enumerate(self.panel_origins):
+            # Paste image
+            canvas.paste(images[i], (x, y_img))
+
+            # Wrap and center text inside the caption box
+            text = story_dict.get(f"text{i + 1}", "")
+            caption = fit_text(text, self.font_text_path, caption_width, caption_height,
+                               *self.text_font_sizes, spacing=LINE_SPACING)
+            caption.draw(draw, x + CAPTION_MARGIN, y_img + self.panel_size + CAPTION_TOP, caption_width)
+
+        return canvas
+
+
+def get_layout_template(panel_count=3, arrangement="row", base_image_path=base_image_path,
+                        font_title_path=font_title_path, font_text_path=font_text_path):
+    """Return a shared LayoutTemplate, built on first use."""
+    return _shared_template(panel_count, arrangement, base_image_path, font_title_path, font_text_path)
+
+
+@lru_cache(maxsize=16)
+def _shared_template(panel_count, arrangement, base_image_path, font_title_path, font_text_path):
+    return LayoutTemplate(panel_count=panel_count, arrangement=arrangement, base_image_path=base_image_path,
+                          font_title_path=font_title_path, font_text_path=font_text_path)
+
+
 def generate_comic_strip(images, story_dict, base_image_path=base_image_path, output_path="comic_strip_centered.png",
                          font_title_path=font_title_path,
                          font_text_path=font_text_path):
@@ -20,66 +163,31 @@ def generate_comic_strip(images, story_dict, base_image_path=base_image_path, ou
         font_title_path (str): Path to the title font file.
         font_text_path (str): Path to the text font file.
     """
-
-    try:
-        font_title = ImageFont.truetype(font_title_path, 50)
-        font_text = ImageFont.truetype(font_text_path, 14)
-    except Exception as e:
-        print(f"Error loading fonts: {e}. Falling back to default fonts.")
-        font_title = ImageFont.load_default()
-        font_text = ImageFont.load_default()
-
-    image_width = 300
-    image_height = 300
-    images = [img.resize((image_width, image_height)) for img in images]
-
-    panel_count = 3
-    padding = 20
-    title_height = 80
-    text_box_height = 100
-
-    panel_width = image_width * panel_count + padding * (panel_count + 1)
-    panel_height = title_height + image_height + text_box_height + padding * 3
-
-    # Load base image or create a white canvas
-    if base_image_path and os.path.exists(base_image_path):
-        base_img = Image.open(base_image_path).convert("RGB")
-        base_img = base_img.resize((panel_width, panel_height))
-        canvas = base_img.copy()
-    else:
-        canvas = Image.new("RGB", (panel_width, panel_height), color="white")
-
-    draw = ImageDraw.Draw(canvas)
-
-    # Draw title centered
-    title = story_dict["title"]
-    bbox = draw.textbbox((0, 0), title, font=font_title)
-    title_x = (panel_width - (bbox[2] - bbox[0])) // 2
-    draw.text((title_x, padding), title, fill="black", font=font_title)
-
-    texts = [story_dict["text1"], story_dict["text2"], story_dict["text3"]]
-
-    for i in range(panel_count):
-        x = padding + i * (image_width + padding)
-        y_img = title_height + padding
-        y_text = y_img + image_height + 10
-
-        # Paste image
-        canvas.paste(images[i], (x, y_img))
-
-        # Wrap and center text
-        text = texts[i]
-        wrapped = textwrap.wrap(text, width=28)
-        for j, line in enumerate(wrapped):
-            line_bbox = draw.textbbox((0, 0), line, font=font_text)
-            text_x = x + (image_width - (line_bbox[2] - line_bbox[0])) // 2
-            text_y = y_text + j * (font_text.getbbox(line)[3] + 5)
-            draw.text((text_x, text_y), line, fill="black", font=font_text)
-
-        # Optional border
-        draw.rectangle([x - 2, y_img - 2, x + image_width + 2, y_img + image_height + text_box_height],
-                       outline="black", width=2)
-
+    canvas = render_comic_strip(images, story_dict, base_image_path=base_image_path,
+                                font_title_path=font_title_path, font_text_path=font_text_path)
     canvas.save(output_path)
     print(f"Saved comic strip with background to: {output_path}")
     return output_path
+
+
+def render_comic_strip(images, story_dict, base_image_path=base_image_path,
+                       font_title_path=font_title_path,
+                       font_text_path=font_text_path):
+    """
+    Same layout as generate_comic_strip, but returns the canvas as a PIL image instead of saving it.
+    """
+    template = get_layout_template(len(images), "row", base_image_path, font_title_path, font_text_path)
+    return template.render(images, story_dict)
+
+
+def prepare_comic_panels(images, base_image_path=base_image_path,
+                         font_title_path=font_title_path,
+                         font_text_path=font_text_path):
+    """
+    Build (or fetch) the layout template for these panels and resize them to it.
+
+    Lets callers do the layout preparation while other work, such as the story call,
+    is still running; render_comic_strip then skips the resize.
+    """
+    template = get_layout_template(len(images), "row", base_image_path, font_title_path, font_text_path)
+    return template.prepare_panels(images)
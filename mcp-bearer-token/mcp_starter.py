@@ -1,21 +1,43 @@
+import time
+BOOT_STARTED = time.perf_counter()
+
 import asyncio
-from typing import Annotated
+from typing import Annotated, Literal
 import os
 from dotenv import load_dotenv
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
 from fastmcp.server.auth.providers.bearer import BearerAuthProvider, RSAKeyPair
 from mcp import ErrorData, McpError
 from mcp.server.auth.provider import AccessToken
 from mcp.types import TextContent, ImageContent, INVALID_PARAMS, INTERNAL_ERROR
 from pydantic import BaseModel, Field, AnyUrl
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
 
-import markdownify
 import httpx
-import readabilipy
 import base64
-import io
-import time
-from PIL import Image
+import codecs
+import contextlib
+
+from clients import close_clients, get_genai_client, get_http_client
+from worker_pool import comic_pool, prep_pool
+from render_pool import render_pool
+from admission import comic_admission, current_client_id
+from result_cache import result_cache
+from encoding import output_settings
+from ingest import ingest_image, open_image
+from job_store import job_store
+from style_registry import ComicStyle, style_registry
+from fetch_cache import CachedPage, fetch_cache, markdown_cache
+from metrics import panel_count, payload_bytes, record_stage, render_prometheus, span, startup_seconds, trace_request
+
+# Comic pipeline (the hot path): imported here so the first request does not pay for it
+from image_generation import generate_comic_panel_images, generate_comic_panels_and_story
+from text_generation import generate_comic_story_from_images, generate_comic_story_from_guide
+from layout_generation import get_layout_template
+from texture import warm_texture_cache
+
+IMPORTS_DONE = time.perf_counter()
 
 # --- Load environment variables ---
 load_dotenv()
@@ -34,14 +56,15 @@ class SimpleBearerAuthProvider(BearerAuthProvider):
         self.token = token
 
     async def load_access_token(self, token: str) -> AccessToken | None:
-        if token == self.token:
-            return AccessToken(
-                token=token,
-                client_id="puch-client",
-                scopes=["*"],
-                expires_at=None,
-            )
-        return None
+        with span("auth"):
+            if token == self.token:
+                return AccessToken(
+                    token=token,
+                    client_id="puch-client",
+                    scopes=["*"],
+                    expires_at=None,
+                )
+            return None
 
 # --- Rich Tool Description model ---
 class RichToolDescription(BaseModel):
@@ -50,8 +73,47 @@ class RichToolDescription(BaseModel):
     side_effects: str | None = None
 
 # --- Fetch Utility Class ---
+FETCH_EXTRACTION_MODE = os.environ.get("FETCH_EXTRACTION_MODE", "readability")  # or "python" (no Node.js subprocess)
+FETCH_PER_HOST_LIMIT = int(os.environ.get("FETCH_PER_HOST_LIMIT", "2"))  # concurrent requests per host
+FETCH_DEADLINE_S = float(os.environ.get("FETCH_DEADLINE_S", "20"))  # whole search_and_fetch call
+FETCH_MAX_PAGE_CHARS = int(os.environ.get("FETCH_MAX_PAGE_CHARS", "20000"))  # per page returned by search_and_fetch
+FETCH_MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", str(2 * 1024 * 1024)))  # body bytes read per response
+TEXT_CONTENT_TYPES = ("application/json", "application/xml", "application/javascript", "application/x-javascript")
+
+def is_text_content(content_type: str) -> bool:
+    """Whether a response body of this Content-Type can be returned as text (unknown types are tried)."""
+    mime = content_type.split(";")[0].strip().lower()
+    return (
+        not mime
+        or mime.startswith("text/")
+        or mime in TEXT_CONTENT_TYPES
+        or mime.endswith("+xml")
+        or mime.endswith("+json")
+    )
+
 class Fetch:
     USER_AGENT = "Puch/1.0 (Autonomous)"
+    _host_slots: dict[str, asyncio.Semaphore] = {}
+    _host_users: dict[str, int] = {}  # requests holding or waiting for each host's slot
+
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def host_slot(cls, url: str):
+        """Limit concurrent requests to the host of url to FETCH_PER_HOST_LIMIT."""
+        host = httpx.URL(url).host
+        slot = cls._host_slots.get(host)
+        if slot is None:
+            slot = cls._host_slots[host] = asyncio.Semaphore(FETCH_PER_HOST_LIMIT)
+        cls._host_users[host] = cls._host_users.get(host, 0) + 1
+        try:
+            async with slot:
+                yield
+        finally:
+            # Forget hosts nobody is using, so the table does not grow without bound
+            cls._host_users[host] -= 1
+            if not cls._host_users[host]:
+                del cls._host_users[host]
+                del cls._host_slots[host]
 
     @classmethod
     async def fetch_url(
@@ -59,41 +121,111 @@ class Fetch:
         url: str,
         user_agent: str,
         force_raw: bool = False,
+        timeout: float = 30,
+        max_bytes: int = FETCH_MAX_BYTES,
     ) -> tuple[str, str]:
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    url,
-                    follow_redirects=True,
-                    headers={"User-Agent": user_agent},
-                    timeout=30,
-                )
-            except httpx.HTTPError as e:
-                raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
-
-            if response.status_code >= 400:
-                raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url} - status code {response.status_code}"))
+        with span("fetch"):
+            page = fetch_cache.get(url, max_bytes)
+            if page is None or not page.is_fresh():
+                # Stale pages are revalidated with If-None-Match / If-Modified-Since
+                headers = {"User-Agent": user_agent}
+                if page is not None:
+                    headers.update(page.validators())
+                client = get_http_client()
+                try:
+                    async with cls.host_slot(url), client.stream(
+                        "GET",
+                        url,
+                        follow_redirects=True,
+                        headers=headers,
+                        timeout=timeout,
+                    ) as response:
+                        if response.status_code == 304 and page is not None:
+                            fetch_cache.refresh(url, page, response)
+                        elif response.status_code >= 400:
+                            raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url} - status code {response.status_code}"))
+                        else:
+                            content_type = response.headers.get("content-type", "")
+                            if not is_text_content(content_type):
+                                # Do not download PDFs, images, archives...
+                                raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url} - unsupported content type {content_type}"))
+                            text, truncated = await cls.read_text(response, max_bytes)
+                            truncated_at = max_bytes if truncated else None
+                            page = fetch_cache.store(url, response, text, truncated_at=truncated_at) or CachedPage(
+                                text, content_type, None, None, 0, truncated_at=truncated_at
+                            )
+                except httpx.HTTPError as e:
+                    raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Failed to fetch {url}: {e!r}"))
 
-            page_raw = response.text
+            # A page cached under a larger limit still honours this call's max_bytes
+            page_raw, truncated_at = page.clipped(max_bytes)
 
-        content_type = response.headers.get("content-type", "")
+        content_type = page.content_type
         is_page_html = "text/html" in content_type
 
+        marker = f"\n\n<truncated: response exceeded {truncated_at} bytes>" if truncated_at else ""
+
         if is_page_html and not force_raw:
-            return cls.extract_content_from_html(page_raw), ""
+            with span("extract"):
+                return await asyncio.to_thread(cls.extract_content_from_html, page_raw) + marker, ""
 
         return (
-            page_raw,
+            page_raw + marker,
             f"Content type {content_type} cannot be simplified to markdown, but here is the raw content:\n",
         )
 
     @staticmethod
-    def extract_content_from_html(html: str) -> str:
-        """Extract and convert HTML content to Markdown format."""
-        ret = readabilipy.simple_json.simple_json_from_html_string(html, use_readability=True)
+    async def read_text(response: httpx.Response, max_bytes: int) -> tuple[str, bool]:
+        """
+        Read and decode a streamed body, stopping after max_bytes.
+
+        Returns:
+            tuple: (decoded text, whether the body was cut off)
+        """
+        try:
+            decoder = codecs.getincrementaldecoder(response.charset_encoding or "utf-8")(errors="replace")
+        except LookupError:
+            # Unknown charset in the Content-Type header
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            room = max_bytes - received
+            if len(chunk) > room:
+                # No final flush: a character cut in half at the limit is dropped, not replaced
+                chunks.append(decoder.decode(chunk[:room]))
+                return "".join(chunks), True
+            received += len(chunk)
+            chunks.append(decoder.decode(chunk))
+        return "".join(chunks) + decoder.decode(b"", final=True), False
+
+    @staticmethod
+    def extract_content_from_html(html: str, mode: str | None = None) -> str:
+        """
+        Extract and convert HTML content to Markdown format.
+
+        Results are cached by a hash of the HTML, so an unchanged page is only converted once.
+
+        Args:
+            html (str): The page HTML.
+            mode (str): "readability" runs Mozilla Readability in a Node.js subprocess;
+                "python" uses readabilipy's pure-Python extractor. Defaults to FETCH_EXTRACTION_MODE.
+        """
+        mode = mode or FETCH_EXTRACTION_MODE
+        key = markdown_cache.make_key(html, mode)
+        cached = markdown_cache.get(key)
+        if cached is not None:
+            return cached
+
+        # Only the fetch helpers need these; keep them out of server startup
+        import markdownify
+        import readabilipy.simple_json
+
+        ret = readabilipy.simple_json.simple_json_from_html_string(html, use_readability=(mode == "readability"))
         if not ret or not ret.get("content"):
             return "<error>Page failed to be simplified from HTML</error>"
         content = markdownify.markdownify(ret["content"], heading_style=markdownify.ATX)
+        markdown_cache.put(key, content)
         return content
 
     @staticmethod
@@ -105,22 +237,67 @@ class Fetch:
         ddg_url = f"https://html.duckduckgo.com/html/?q={query.replace(' ', '+')}"
         links = []
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(ddg_url, headers={"User-Agent": Fetch.USER_AGENT})
-            if resp.status_code != 200:
-                return ["<error>Failed to perform search.</error>"]
+        resp = await get_http_client().get(ddg_url, headers={"User-Agent": Fetch.USER_AGENT})
+        if resp.status_code != 200:
+            return ["<error>Failed to perform search.</error>"]
 
         from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, "html.parser")
         for a in soup.find_all("a", class_="result__a", href=True):
             href = a["href"]
             if "http" in href:
-                links.append(href)
+                links.append(Fetch.unwrap_search_link(href))
             if len(links) >= num_results:
                 break
 
         return links or ["<error>No results found.</error>"]
 
+    @staticmethod
+    def unwrap_search_link(href: str) -> str:
+        """Target URL of a DuckDuckGo redirect link (//duckduckgo.com/l/?uddg=...), or href unchanged."""
+        if href.startswith("//"):
+            href = "https:" + href
+        url = httpx.URL(href)
+        if url.host.endswith("duckduckgo.com") and url.path == "/l/" and "uddg" in url.params:
+            return url.params["uddg"]
+        return href
+
+    @classmethod
+    async def fetch_many(cls, urls: list[str], deadline: float, max_chars: int = FETCH_MAX_PAGE_CHARS):
+        """
+        Fetch and extract urls concurrently, yielding each result as soon as it is ready.
+
+        Requests to the same host are limited by host_slot; pages still missing at the
+        event-loop time deadline are reported as timed out.
+
+        Yields:
+            tuple: (index into urls, url, content or None, error message or None)
+        """
+        async def fetch_one(index, url):
+            try:
+                async with asyncio.timeout_at(deadline):
+                    remaining = deadline - asyncio.get_running_loop().time()
+                    content, prefix = await cls.fetch_url(url, cls.USER_AGENT, timeout=min(30, remaining))
+            except TimeoutError:
+                return index, url, None, "timed out"
+            except McpError as e:
+                return index, url, None, e.error.message
+            except Exception as e:
+                # One bad page must not fail the whole search
+                return index, url, None, f"Failed to fetch {url}: {e!r}"
+            content = prefix + content
+            if len(content) > max_chars:
+                content = content[:max_chars] + f"\n\n<truncated: page continues beyond {max_chars} characters>"
+            return index, url, content, None
+
+        tasks = [asyncio.create_task(fetch_one(index, url)) for index, url in enumerate(urls)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
 # --- MCP Server Setup ---
 mcp = FastMCP(
     "Job Finder & Comic Generator MCP Server",
@@ -133,6 +310,50 @@ async def validate() -> str:
     return MY_NUMBER
 
 
+# --- Tool: search_and_fetch ---
+SEARCH_AND_FETCH_DESCRIPTION = RichToolDescription(
+    description="Search the web and return the readable content of the top result pages.",
+    use_when="Use this when the user needs information gathered from several web pages, e.g. job postings matching a query.",
+    side_effects="Fetches up to num_results pages concurrently; each page is also sent as a log notification as soon as it is ready.",
+)
+
+@mcp.tool(description=SEARCH_AND_FETCH_DESCRIPTION.model_dump_json())
+async def search_and_fetch(
+    query: Annotated[str, Field(description="Search query")],
+    num_results: Annotated[int, Field(description="Number of result pages to fetch", ge=1, le=10)] = 5,
+    max_chars_per_page: Annotated[int, Field(description="Longest content returned per page", ge=500)] = FETCH_MAX_PAGE_CHARS,
+    ctx: Context | None = None,
+) -> list[TextContent]:
+    """
+    Search, then fetch all result pages concurrently. Pages are reported to the client
+    (log notifications on logger fetch.results) in completion order and returned in rank order.
+    """
+    deadline = asyncio.get_running_loop().time() + FETCH_DEADLINE_S
+    with trace_request("search_and_fetch"):
+        try:
+            async with asyncio.timeout_at(deadline):
+                links = await Fetch.google_search_links(query, num_results)
+        except TimeoutError:
+            raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Search timed out after {FETCH_DEADLINE_S:g}s"))
+        if links[0].startswith("<error>"):
+            raise McpError(ErrorData(code=INTERNAL_ERROR, message=links[0]))
+        
+        pages = [None] * len(links)
+        async for index, url, content, error in Fetch.fetch_many(links, deadline, max_chars_per_page):
+            body = content if error is None else f"<error>{error}</error>"
+            pages[index] = f"## {index + 1}. {url}\n\n{body}"
+            if ctx is not None:
+                finished = sum(page is not None for page in pages)
+                await ctx.report_progress(finished, len(links), f"Fetched {url}")
+                await ctx.log(
+                    f"Result {index + 1} fetched: {url}",
+                    level="info" if error is None else "warning",
+                    logger_name="fetch.results",
+                    extra={"rank": index + 1, "url": url, "content": content, "error": error},
+                )
+        
+        return [TextContent(type="text", text=page) for page in pages]
+
 # Comic Generation Tool
 COMIC_GENERATION_DESCRIPTION = RichToolDescription(
     description="Generate a 3-panel comic strip from a base image and story guide using AI.",
@@ -140,119 +361,569 @@ COMIC_GENERATION_DESCRIPTION = RichToolDescription(
     side_effects="Generates 3 comic panels and combines them into a final comic strip with text overlay.",
 )
 
+COMIC_STAGES = 3  # panels, story, render
+COMIC_DEADLINE = float(os.environ.get("COMIC_DEADLINE_S", "180"))  # seconds per tool call, including retries
+COMIC_SINGLE_CALL = os.environ.get("COMIC_SINGLE_CALL", "0") == "1"  # take captions from the image call by default
+
+async def report_comic_progress(ctx: Context | None, step: float, message: str):
+    if ctx is not None:
+        await ctx.report_progress(step, COMIC_STAGES, message)
+
+async def send_comic_panel(ctx: Context, panel_number: int, image_bytes: bytes, mime_type: str):
+    """Send a freshly generated panel to the client as a log notification."""
+    # Stay below 1, which "Panels generated" reports: progress must strictly increase
+    await report_comic_progress(ctx, panel_number / 4, f"Panel {panel_number} generated")
+    await ctx.log(
+        f"Panel {panel_number} generated",
+        level="info",
+        logger_name="comic.panels",
+        extra={
+            "panel": panel_number,
+            "mimeType": mime_type or "image/png",
+            "data": base64.b64encode(image_bytes).decode("utf-8"),
+        },
+    )
+
+async def generate_panels(ctx: Context | None, stream_panels: bool, generate=generate_comic_panel_images, **kwargs):
+    """
+    Run a panel generator (generate_comic_panel_images or generate_comic_panels_and_story)
+    on the worker pool. With stream_panels, each panel is forwarded to the client from the
+    event loop as soon as the worker decodes it.
+    """
+    if not stream_panels or ctx is None:
+        return await comic_pool.run(generate, **kwargs)
+
+    loop = asyncio.get_running_loop()
+    panel_queue: asyncio.Queue = asyncio.Queue()
+
+    def on_panel(panel_number, image_bytes, mime_type):
+        loop.call_soon_threadsafe(panel_queue.put_nowait, (panel_number, image_bytes, mime_type))
+
+    async def forward_panels():
+        while (item := await panel_queue.get()) is not None:
+            await send_comic_panel(ctx, *item)
+
+    forwarder = asyncio.create_task(forward_panels())
+    try:
+        return await comic_pool.run(generate, on_panel=on_panel, **kwargs)
+    finally:
+        panel_queue.put_nowait(None)
+        await forwarder
+
+def release_prepared(task: asyncio.Task):
+    """Done callback closing the PreparedPanels of a render that will not happen."""
+    if not task.cancelled() and task.exception() is None:
+        task.result().close()
+
+# Short CPU steps get their own threads, so they never wait behind the blocking Gemini calls
+PREP_STAGES = ("decode", "style_prep")
+
+async def run_stage(stage: str, fn, *args, **kwargs):
+    """Run a blocking pipeline step on the worker pool (or the prep pool) inside a metrics span."""
+    pool = prep_pool if stage in PREP_STAGES else comic_pool
+    with span(stage):
+        return await pool.run(fn, *args, **kwargs)
+
+async def run_comic_pipeline(
+    ctx: Context | None,
+    base_image,
+    style: ComicStyle,
+    story_guide: str,
+    character_name: str,
+    stream_panels: bool = False,
+    parallel_story: bool = False,
+    deadline: float | None = None,
+    output: dict | None = None,
+    single_call: bool | None = None,
+) -> dict:
+    """
+    Generate panels and story, then lay out, texture and encode the strip.
+
+    Args:
+        style (ComicStyle): Style reference, sent to Gemini inline or by File API handle.
+        output (dict): encode_image settings, from encoding.output_settings().
+        single_call (bool): Ask the image model for the captions too and only make the
+            story call if they cannot be parsed (default: COMIC_SINGLE_CALL). Ignored
+            with parallel_story.
+
+    Returns:
+        dict: 'panels' (PIL images), 'story' (dict), 'final_image' (bytes) and 'mime_type',
+        as stored by result_cache.
+    """
+    if single_call is None:
+        single_call = COMIC_SINGLE_CALL
+    story = None
+    story_task = None
+    prepare_task = None
+    prepared = None
+    try:
+        if parallel_story:
+            story_task = asyncio.create_task(
+                run_stage("gemini_story", generate_comic_story_from_guide, story_guide, character_name, deadline=deadline)
+            )
+        
+        # Generate comic panels
+        reference_style = await run_stage("style_prep", style.part, deadline)
+        with span("gemini_image"):
+            panel_kwargs = dict(story_guide=story_guide, base_image=base_image, reference_style=reference_style, deadline=deadline)
+            if single_call and story_task is None:
+                panel_images, story = await generate_panels(
+                    ctx, stream_panels, generate_comic_panels_and_story, name=character_name, **panel_kwargs
+                )
+                if story is None:
+                    print("No captions in the image response, falling back to the story call")
+            else:
+                panel_images = await generate_panels(ctx, stream_panels, **panel_kwargs)
+        panel_count.observe(len(panel_images))
+        if len(panel_images) < 3:
+            raise ValueError(f"Expected 3 comic panels from Gemini, got {len(panel_images)}")
+        panel_images = panel_images[:3]
+        await report_comic_progress(ctx, 1, "Panels generated")
+        
+        # Resize the panels and hand them to the render workers while the story is written
+        prepare_task = asyncio.create_task(render_pool.prepare(panel_images))
+        
+        # Generate story, unless it came with the panels
+        if story is None:
+            if story_task is None:
+                story_task = asyncio.create_task(
+                    run_stage("gemini_story", generate_comic_story_from_images, panel_images, character_name, deadline=deadline)
+                )
+            story = await story_task
+        prepared = await prepare_task
+    finally:
+        if story_task is not None and not story_task.done():
+            story_task.cancel()
+        if prepare_task is not None and prepared is None:
+            # Not rendering after all: free the shared memory once the preparation finishes
+            prepare_task.add_done_callback(release_prepared)
+    await report_comic_progress(ctx, 2, "Story generated")
+    
+    # Lay out, texture and encode the strip on the render processes
+    with span("render"):
+        final_image, mime_type, timings = await render_pool.render(prepared, story, output or output_settings())
+    for stage, seconds in timings.items():
+        record_stage(stage, seconds)
+    await report_comic_progress(ctx, 3, "Comic rendered")
+    
+    return {"panels": panel_images, "story": story, "final_image": final_image, "mime_type": mime_type}
+
+async def resolve_style(reference_style_data: str | None, style_id: str | None, base_image_bytes: bytes, base_image) -> ComicStyle:
+    """
+    Pick the style reference: an uploaded reference, else the registered style_id, else the
+    'default' style, else the base image itself.
+    """
+    if reference_style_data:
+        payload_bytes.observe(len(reference_style_data), direction="in")
+        ref_image_bytes, reference_style_image = await run_stage(
+            "decode", ingest_image, reference_style_data, name="reference_style_data"
+        )
+        return await run_stage("style_prep", style_registry.from_upload, ref_image_bytes, reference_style_image)
+    
+    style = await run_stage("style_prep", style_registry.get, style_id or "default")
+    if style is not None:
+        return style
+    if style_id:
+        raise McpError(ErrorData(
+            code=INVALID_PARAMS,
+            message=f"Unknown style_id '{style_id}', available styles: {', '.join(style_registry.names()) or 'none'}",
+        ))
+    return await run_stage("style_prep", style_registry.from_upload, base_image_bytes, base_image)  # Use base image as reference
+
+async def generate_comic(
+    ctx: Context | None,
+    base_image_bytes: bytes,
+    base_image,
+    style: ComicStyle,
+    story_guide: str,
+    character_name: str,
+    output: dict,
+    deadline: float,
+    stream_panels: bool = False,
+    parallel_story: bool = False,
+    single_call: bool | None = None,
+    wait_for_slot: bool = False,
+) -> dict:
+    """
+    Return a cached comic for identical inputs, or generate one under admission control and cache it.
+
+    With wait_for_slot the call waits for an admission slot however long the queue is,
+    instead of failing with a retry-after error; used by comic jobs, which have their own cap.
+    """
+    if single_call is None:
+        single_call = COMIC_SINGLE_CALL
+    # Where the captions come from changes them, so both modes are part of the key
+    cache_key = result_cache.make_key(
+        base_image_bytes,
+        style.data,
+        story_guide=story_guide,
+        character_name=character_name,
+        output=output,
+        parallel_story=parallel_story,
+        single_call=single_call and not parallel_story,
+    )
+    with span("cache_lookup"):
+        cached = await result_cache.get(cache_key)
+    if cached is not None:
+        await report_comic_progress(ctx, COMIC_STAGES, "Comic served from cache")
+        return cached
+    
+    async with comic_admission.admit(current_client_id(), reject=not wait_for_slot):
+        result = await run_comic_pipeline(
+            ctx,
+            base_image,
+            style,
+            story_guide,
+            character_name,
+            stream_panels=stream_panels,
+            parallel_story=parallel_story,
+            deadline=deadline,
+            output=output,
+            single_call=single_call,
+        )
+    await result_cache.put(cache_key, result)
+    return result
+
+def format_story(story: dict) -> str:
+    return f"**{story['title']}**\n\n1. {story['text1']}\n2. {story['text2']}\n3. {story['text3']}"
+
+def comic_image_content(result: dict) -> ImageContent:
+    with span("response_encode"):
+        final_comic_base64 = base64.b64encode(result["final_image"]).decode("utf-8")
+    payload_bytes.observe(len(final_comic_base64), direction="out")
+    return ImageContent(type="image", mimeType=result["mime_type"], data=final_comic_base64)
+
 @mcp.tool(description=COMIC_GENERATION_DESCRIPTION.model_dump_json())
 async def generate_comic_strip_tool(
     puch_image_data: Annotated[str, Field(description="Base64-encoded image ")],
     story_guide: Annotated[str, Field(description="Very descriptive Story theme or guide for the comic")] = "Jokes about hackathon",
     character_name: Annotated[str, Field(description="Name of the character in the comic")] = "Your Name",
     reference_style_data: Annotated[str | None, Field(description="Base64-encoded reference style image (optional)")] = None,
+    style_id: Annotated[str | None, Field(description="Name of a registered comic style (see list_comic_styles); ignored when reference_style_data is given")] = None,
+    stream_panels: Annotated[bool, Field(description="Send each panel as a log notification as soon as it is generated")] = False,
+    parallel_story: Annotated[bool, Field(description="Write the story from the story guide while the panels are drawn (faster, captions may match the panels less closely)")] = False,
+    single_call: Annotated[bool | None, Field(description="Have the image model write the captions too, saving the separate story call; it is still made if no captions come back (default: server setting)")] = None,
+    output_format: Annotated[Literal["png", "webp", "jpeg"] | None, Field(description="Image format of the comic (default: server setting, normally png)")] = None,
+    max_output_bytes: Annotated[int | None, Field(description="Byte budget for the encoded comic; quality and size are lowered until it fits")] = None,
+    ctx: Context | None = None,
 ) -> list[TextContent | ImageContent]:
     """
     Generate a complete 3-panel comic strip from a base image with AI-generated panels and story.
     """
-    import base64
-    import io
-    import tempfile
-    import shutil
-    from PIL import Image
-
-    try:
-        # Decode base image (following the same pattern as make_img_black_and_white)
-        base_image_bytes = base64.b64decode(puch_image_data)
-        base_image = Image.open(io.BytesIO(base_image_bytes))
-        
-        # Decode reference style image if provided
-        reference_style_image = None
-        if reference_style_data:
-            ref_image_bytes = base64.b64decode(reference_style_data)
-            reference_style_image = Image.open(io.BytesIO(ref_image_bytes))
-        
-        # Import comic generation modules
-        from text_generation import generate_comic_story
-        from image_generation import generate_comic_panels
-        from layout_generation import generate_comic_strip
-        from texture import apply_texture_overlay
-        
-        # Create temporary directory for processing
-        temp_dir = tempfile.mkdtemp()
-        
+    deadline = time.monotonic() + COMIC_DEADLINE
+    with trace_request("generate_comic_strip_tool"):
         try:
-            # Save base image to temp directory
-            base_image_path = os.path.join(temp_dir, "base_image.jpg")
-            base_image.save(base_image_path)
+            # Turn the call away before decoding anything if it could not be queued
+            comic_admission.check(current_client_id())
             
-            # Handle reference style image
-            if reference_style_image:
-                reference_style_path = os.path.join(temp_dir, "reference_style.jpg")
-                reference_style_image.save(reference_style_path)
-            else:
-                # Use default reference style if available
-                default_ref_path = os.path.join(os.path.dirname(__file__), "Test_Images", "StyleReference.jpg")
-                if os.path.exists(default_ref_path):
-                    reference_style_path = default_ref_path
-                else:
-                    reference_style_path = base_image_path  # Use base image as reference
-            
-            # Generate comic panels
-            panels_dir = os.path.join(temp_dir, "panels")
-            generate_comic_panels(
-                story_guide=story_guide,
-                base_image_path=base_image_path,
-                reference_style_path=reference_style_path,
-                output_dir=panels_dir
+            # Validate, size-check and decode the base image at a capped resolution
+            payload_bytes.observe(len(puch_image_data), direction="in")
+            base_image_bytes, base_image = await run_stage("decode", ingest_image, puch_image_data, name="puch_image_data")
+            style = await resolve_style(reference_style_data, style_id, base_image_bytes, base_image)
+        
+            result = await generate_comic(
+                ctx,
+                base_image_bytes,
+                base_image,
+                style,
+                story_guide,
+                character_name,
+                output=output_settings(output_format, max_output_bytes),
+                deadline=deadline,
+                stream_panels=stream_panels,
+                parallel_story=parallel_story,
+                single_call=single_call,
             )
-            
-            # Get generated panel paths
-            comic_images = [
-                os.path.join(panels_dir, "comic_panel_1.png"),
-                os.path.join(panels_dir, "comic_panel_2.png"),
-                os.path.join(panels_dir, "comic_panel_3.png")
-            ]
-            
-            # Generate story
-            story = generate_comic_story(comic_images, character_name)
-            
-            # Load panel images for layout
-            panel_images = [
-                Image.open(comic_images[0]),
-                Image.open(comic_images[1]),
-                Image.open(comic_images[2])
+            image_content = comic_image_content(result)
+        
+            # Create response with story and image
+            print(f"Comic pool: {comic_pool.stats()} | prep: {prep_pool.stats()} | render: {render_pool.stats()} | cache: {result_cache.stats()} | admission: {comic_admission.stats()}")
+            return [
+                TextContent(type="text", text=format_story(result["story"])),
+                image_content,
             ]
             
-            # Generate comic strip layout
-            comic_strip_path = os.path.join(temp_dir, "comic_strip.png")
-            generate_comic_strip(panel_images, story, output_path=comic_strip_path)
-            
-            # Apply texture overlay
-            final_comic_path = os.path.join(temp_dir, "final_comic.png")
-            apply_texture_overlay(comic_strip_path, output_path=final_comic_path)
+        except McpError:
+            raise
+        except Exception as e:
+            raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
+
+# --- Tool: batch comic generation ---
+COMIC_BATCH_MAX_ITEMS = int(os.environ.get("COMIC_BATCH_MAX_ITEMS", "8"))
+COMIC_BATCH_CONCURRENCY = int(os.environ.get("COMIC_BATCH_CONCURRENCY", "3"))
+
+COMIC_BATCH_DESCRIPTION = RichToolDescription(
+    description="Generate several 3-panel comic strips from one base image, one per story guide.",
+    use_when="Use this tool when the user wants more than one comic from the same photo with different story themes or characters.",
+    side_effects="Generates a comic strip per story; a failed story is reported in the result without failing the others.",
+)
+
+class ComicStoryRequest(BaseModel):
+    story_guide: str = Field(description="Very descriptive Story theme or guide for this comic")
+    character_name: str = Field(default="Your Name", description="Name of the character in this comic")
+
+@mcp.tool(description=COMIC_BATCH_DESCRIPTION.model_dump_json())
+async def generate_comic_strips_batch(
+    puch_image_data: Annotated[str, Field(description="Base64-encoded image shared by all comics")],
+    stories: Annotated[list[ComicStoryRequest], Field(description="One entry per comic", min_length=1)],
+    reference_style_data: Annotated[str | None, Field(description="Base64-encoded reference style image (optional)")] = None,
+    style_id: Annotated[str | None, Field(description="Name of a registered comic style (see list_comic_styles); ignored when reference_style_data is given")] = None,
+    output_format: Annotated[Literal["png", "webp", "jpeg"] | None, Field(description="Image format of the comics (default: server setting, normally png)")] = None,
+    max_output_bytes: Annotated[int | None, Field(description="Byte budget for each encoded comic")] = None,
+    ctx: Context | None = None,
+) -> list[TextContent | ImageContent]:
+    """
+    Generate one comic strip per story from a single base image. The image and style reference
+    are decoded once and the comics are generated concurrently, up to COMIC_BATCH_CONCURRENCY
+    at a time. Each comic is returned as a text and an image item; failed comics as a text item.
+    """
+    if len(stories) > COMIC_BATCH_MAX_ITEMS:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f"At most {COMIC_BATCH_MAX_ITEMS} stories per batch, got {len(stories)}"))
+    
+    with trace_request("generate_comic_strips_batch"):
+        try:
+            comic_admission.check(current_client_id())
+            payload_bytes.observe(len(puch_image_data), direction="in")
+            base_image_bytes, base_image = await run_stage("decode", ingest_image, puch_image_data, name="puch_image_data")
+            style = await resolve_style(reference_style_data, style_id, base_image_bytes, base_image)
+            output = output_settings(output_format, max_output_bytes)
             
-            # Read final comic and convert to base64 (following the same pattern as make_img_black_and_white)
-            with open(final_comic_path, "rb") as f:
-                final_comic_bytes = f.read()
+            limit = asyncio.Semaphore(COMIC_BATCH_CONCURRENCY)
+            finished = 0
             
-            final_comic_base64 = base64.b64encode(final_comic_bytes).decode("utf-8")
+            async def generate_one(item: ComicStoryRequest) -> dict:
+                nonlocal finished
+                async with limit:
+                    try:
+                        return await generate_comic(
+                            None,
+                            base_image_bytes,
+                            base_image,
+                            style,
+                            item.story_guide,
+                            item.character_name,
+                            output=output,
+                            deadline=time.monotonic() + COMIC_DEADLINE,
+                        )
+                    finally:
+                        finished += 1
+                        if ctx is not None:
+                            await ctx.report_progress(finished, len(stories), f"{finished} of {len(stories)} comics done")
             
-            # Create response with story and image
-            story_text = f"**{story['title']}**\n\n1. {story['text1']}\n2. {story['text2']}\n3. {story['text3']}"
+            results = await asyncio.gather(*(generate_one(item) for item in stories), return_exceptions=True)
             
-            return [
-                TextContent(type="text", text=story_text),
-                ImageContent(type="image", mimeType="image/png", data=final_comic_base64)
-            ]
+            content = []
+            for number, (item, result) in enumerate(zip(stories, results), start=1):
+                if isinstance(result, BaseException):
+                    message = result.error.message if isinstance(result, McpError) else str(result)
+                    content.append(TextContent(type="text", text=f"Comic {number} ({item.story_guide}) failed: {message}"))
+                    continue
+                content.append(TextContent(type="text", text=f"Comic {number}: {format_story(result['story'])}"))
+                content.append(comic_image_content(result))
             
-        finally:
-            # Clean up temporary directory
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            failed = sum(isinstance(result, BaseException) for result in results)
+            print(f"Comic batch: {len(stories) - failed} ok, {failed} failed | pool: {comic_pool.stats()} | admission: {comic_admission.stats()}")
+            return content
             
+        except McpError:
+            raise
+        except Exception as e:
+            raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
+
+# --- Tools: comic jobs (submit now, collect the result later) ---
+COMIC_JOB_CONCURRENCY = int(os.environ.get("COMIC_JOB_CONCURRENCY", "2"))  # jobs generated at once
+COMIC_JOB_MAX_ATTEMPTS = int(os.environ.get("COMIC_JOB_MAX_ATTEMPTS", "3"))  # starts, including restarts, before a job fails
+
+comic_job_slots = asyncio.Semaphore(COMIC_JOB_CONCURRENCY)
+comic_job_tasks: dict[str, asyncio.Task] = {}  # keeps running jobs referenced
+
+SUBMIT_COMIC_JOB_DESCRIPTION = RichToolDescription(
+    description="Start generating a 3-panel comic strip in the background and return a job id right away.",
+    use_when="Use this instead of generate_comic_strip_tool when the client may time out or disconnect before a comic is finished; poll get_comic_job_status, then call get_comic_job_result.",
+    side_effects="Stores the job on the server; it keeps running if the client disconnects or the server restarts. Finished jobs are deleted after COMIC_JOB_TTL.",
+)
+
+class JobProgress:
+    """Stands in for the request Context in the comic pipeline, recording each progress message as a job stage."""
+    
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+    
+    async def report_progress(self, progress: float, total: float | None = None, message: str | None = None):
+        await asyncio.to_thread(job_store.record_stage, self.job_id, message or f"{progress}/{total}")
+
+async def run_comic_job(job_id: str):
+    """Run a stored comic job to completion, saving its result or error in the job store."""
+    try:
+        async with comic_job_slots:
+            attempts = await asyncio.to_thread(job_store.start, job_id)
+            if attempts > COMIC_JOB_MAX_ATTEMPTS:
+                await asyncio.to_thread(job_store.fail, job_id, f"Gave up after {attempts - 1} attempts")
+                return
+            params, base_image_bytes, style_image_bytes = await asyncio.to_thread(job_store.inputs, job_id)
+            with trace_request("comic_job"):
+                base_image = await run_stage("decode", open_image, base_image_bytes, name="puch_image_data")
+                if style_image_bytes is not None:
+                    style_image = await run_stage("decode", open_image, style_image_bytes, name="reference_style_data")
+                    style = await run_stage("style_prep", style_registry.from_upload, style_image_bytes, style_image)
+                else:
+                    style = await resolve_style(None, params["style_id"], base_image_bytes, base_image)
+                result = await generate_comic(
+                    JobProgress(job_id),
+                    base_image_bytes,
+                    base_image,
+                    style,
+                    params["story_guide"],
+                    params["character_name"],
+                    output=params["output"],
+                    deadline=time.monotonic() + COMIC_DEADLINE,
+                    wait_for_slot=True,  # a durable job must not fail just because the server is busy
+                )
+            await asyncio.to_thread(job_store.succeed, job_id, result["story"], result["final_image"], result["mime_type"])
+    except asyncio.CancelledError:
+        raise  # server shutting down: the job stays unfinished and is resumed on the next start
     except Exception as e:
-        raise McpError(ErrorData(code=INTERNAL_ERROR, message=str(e)))
+        message = e.error.message if isinstance(e, McpError) else str(e)
+        print(f"Comic job {job_id} failed: {message}")
+        await asyncio.to_thread(job_store.fail, job_id, message)
+    finally:
+        comic_job_tasks.pop(job_id, None)
+
+def schedule_comic_job(job_id: str):
+    comic_job_tasks[job_id] = asyncio.create_task(run_comic_job(job_id))
+
+async def resume_comic_jobs() -> int:
+    """Drop expired jobs and restart the ones left unfinished by the previous run. Returns how many were restarted."""
+    await asyncio.to_thread(job_store.purge_expired)
+    job_ids = await asyncio.to_thread(job_store.unfinished)
+    for job_id in job_ids:
+        schedule_comic_job(job_id)
+    return len(job_ids)
+
+async def find_comic_job(job_id: str) -> dict:
+    """Status of a job submitted by the current client, or an INVALID_PARAMS error."""
+    status = await asyncio.to_thread(job_store.status, job_id)
+    if status is None or status.pop("client_id") != current_client_id():
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f"Unknown or expired comic job '{job_id}'"))
+    return status
+
+@mcp.tool(description=SUBMIT_COMIC_JOB_DESCRIPTION.model_dump_json())
+async def submit_comic_job(
+    puch_image_data: Annotated[str, Field(description="Base64-encoded image ")],
+    story_guide: Annotated[str, Field(description="Very descriptive Story theme or guide for the comic")] = "Jokes about hackathon",
+    character_name: Annotated[str, Field(description="Name of the character in the comic")] = "Your Name",
+    reference_style_data: Annotated[str | None, Field(description="Base64-encoded reference style image (optional)")] = None,
+    style_id: Annotated[str | None, Field(description="Name of a registered comic style (see list_comic_styles); ignored when reference_style_data is given")] = None,
+    output_format: Annotated[Literal["png", "webp", "jpeg"] | None, Field(description="Image format of the comic (default: server setting, normally png)")] = None,
+    max_output_bytes: Annotated[int | None, Field(description="Byte budget for the encoded comic; quality and size are lowered until it fits")] = None,
+) -> dict:
+    """
+    Validate the inputs, store them as a queued job and start it in the background.
+    Returns {'job_id', 'state'}.
+    """
+    with trace_request("submit_comic_job"):
+        # Reject bad images and unknown styles now, not when the job runs
+        payload_bytes.observe(len(puch_image_data), direction="in")
+        base_image_bytes, base_image = await run_stage("decode", ingest_image, puch_image_data, name="puch_image_data")
+        style_image_bytes = None
+        if reference_style_data:
+            payload_bytes.observe(len(reference_style_data), direction="in")
+            style_image_bytes, _ = await run_stage("decode", ingest_image, reference_style_data, name="reference_style_data")
+        else:
+            await resolve_style(None, style_id, base_image_bytes, base_image)
+        
+        params = {
+            "story_guide": story_guide,
+            "character_name": character_name,
+            "style_id": style_id,
+            "output": output_settings(output_format, max_output_bytes),
+        }
+        await asyncio.to_thread(job_store.purge_expired)
+        job_id = await asyncio.to_thread(job_store.create, current_client_id(), params, base_image_bytes, style_image_bytes)
+        schedule_comic_job(job_id)
+        return {"job_id": job_id, "state": "queued"}
+
+@mcp.tool(description="Check a comic job started with submit_comic_job: its state (queued, running, succeeded or failed), current stage and when each stage was reached.")
+async def get_comic_job_status(
+    job_id: Annotated[str, Field(description="Job id returned by submit_comic_job")],
+) -> dict:
+    return await find_comic_job(job_id)
+
+@mcp.tool(description="Fetch the story and comic image of a succeeded comic job. Fails if the job failed or is not finished yet.")
+async def get_comic_job_result(
+    job_id: Annotated[str, Field(description="Job id returned by submit_comic_job")],
+) -> list[TextContent | ImageContent]:
+    status = await find_comic_job(job_id)
+    if status["state"] == "failed":
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message=f"Comic job {job_id} failed: {status['error']}"))
+    if status["state"] != "succeeded":
+        raise McpError(ErrorData(
+            code=INVALID_PARAMS,
+            message=f"Comic job {job_id} is not finished yet ({status['stage']}); poll get_comic_job_status",
+        ))
+    
+    story, image, mime_type = await asyncio.to_thread(job_store.result, job_id)
+    return [
+        TextContent(type="text", text=format_story(story)),
+        comic_image_content({"final_image": image, "mime_type": mime_type}),
+    ]
+
+# --- Tool: list registered comic styles ---
+@mcp.tool(description="List the comic style names accepted by the style_id parameter of the comic tools.")
+async def list_comic_styles() -> list[str]:
+    return await asyncio.to_thread(style_registry.names)
+
+# --- Metrics route (served next to the streamable-http transport) ---
+@mcp.custom_route("/metrics", methods=["GET"])
+async def metrics_route(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+# --- Startup warm-up ---
+WARM_UP_STEPS = (
+    ("layout", lambda: get_layout_template()),  # fonts and the default 3-panel canvas
+    ("texture", lambda: warm_texture_cache(get_layout_template().size)),
+    ("gemini_client", get_genai_client),
+    ("styles", style_registry.warm),  # load named styles and upload them to the File API
+)
+
+async def warm_up() -> dict:
+    """Do the one-off work of the comic path before the first request. Returns seconds per step."""
+    timings = {"imports": IMPORTS_DONE - BOOT_STARTED}
+    # Start the render processes first: with fork this must happen before any other thread exists
+    started = time.perf_counter()
+    render_pool.start()
+    timings["render_pool"] = time.perf_counter() - started
+    for step, fn in WARM_UP_STEPS:
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(fn)
+        except Exception as e:
+            print(f"Warm-up step {step} failed, it will run on first use: {e!r}")
+        timings[step] = time.perf_counter() - started
+    for step, seconds in timings.items():
+        startup_seconds.observe(seconds, step=step)
+    return timings
 
 # --- Run MCP Server ---
 async def main():
     port = int(os.environ.get("PORT", 8086))  # Railway sets PORT
     print(f"🚀 Starting MCP server on http://0.0.0.0:{port}")
-    await mcp.run_async("streamable-http", host="0.0.0.0", port=port)
+
+    timings = await warm_up()
+    breakdown = ", ".join(f"{step}={seconds:.2f}s" for step, seconds in timings.items())
+    print(f"Ready in {time.perf_counter() - BOOT_STARTED:.2f}s [{breakdown}]")
+    resumed = await resume_comic_jobs()
+    if resumed:
+        print(f"Resumed {resumed} unfinished comic job(s)")
+
+    try:
+        await mcp.run_async("streamable-http", host="0.0.0.0", port=port)
+    finally:
+        render_pool.shutdown()
+        comic_pool.shutdown()
+        prep_pool.shutdown()
+        job_store.close()
+        await close_clients()
 
 
 if __name__ == "__main__":
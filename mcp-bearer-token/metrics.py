@@ -0,0 +1,102 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+SLOW_REQUEST_S = float(os.environ.get("SLOW_REQUEST_S", "60"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+SIZE_BUCKETS = tuple(2 ** n * 1024 for n in range(0, 15, 2))  # 1 KiB .. 16 MiB
+COUNT_BUCKETS = (1, 2, 3, 4, 6, 8, 12)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}  # sorted label items -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                labels = [f'{k}="{v}"' for k, v in key]
+                bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+                counts = series[:len(self.buckets)] + [series[-1]]
+                for bound, count in zip(bounds, counts):
+                    bucket_labels = ",".join(labels + [f'le="{bound}"'])
+                    lines.append(f"{self.name}_bucket{{{bucket_labels}}} {count}")
+                suffix = "{" + ",".join(labels) + "}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {series[-2]}")
+                lines.append(f"{self.name}_count{suffix} {series[-1]}")
+        return "\n".join(lines)
+
+
+stage_seconds = Histogram("comic_stage_seconds", "Time spent in each request stage.", LATENCY_BUCKETS)
+request_seconds = Histogram("mcp_request_seconds", "End-to-end tool call time.", LATENCY_BUCKETS)
+payload_bytes = Histogram("mcp_payload_bytes", "Size of incoming and outgoing payloads.", SIZE_BUCKETS)
+panel_count = Histogram("comic_panel_count", "Panels returned by Gemini per generation.", COUNT_BUCKETS)
+startup_seconds = Histogram("mcp_startup_seconds", "Time spent in each server startup step.", LATENCY_BUCKETS)
+HISTOGRAMS = (stage_seconds, request_seconds, payload_bytes, panel_count, startup_seconds)
+
+# Stage timings of the request being handled; copied into tasks it spawns
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def record_stage(stage, seconds):
+    """Record a stage timing measured elsewhere (e.g. in a worker process)."""
+    stage_seconds.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Time a block, record it in the stage histogram and the current request trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def trace_request(tool):
+    """
+    Collect the spans of one tool call. Calls slower than SLOW_REQUEST_S are printed
+    with their stage breakdown.
+    """
+    trace = []
+    token = _current_trace.set(trace)
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        _current_trace.reset(token)
+        elapsed = time.perf_counter() - started
+        request_seconds.observe(elapsed, tool=tool, status=status)
+        if elapsed >= SLOW_REQUEST_S:
+            breakdown = ", ".join(f"{stage}={seconds:.2f}s" for stage, seconds in trace)
+            print(f"Slow request: {tool} took {elapsed:.2f}s ({status}) [{breakdown}]")
+
+
+def render_prometheus():
+    return "\n\n".join(h.render() for h in HISTOGRAMS) + "\n"
@@ -0,0 +1,249 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+from PIL import Image
+
+from encoding import encode_image
+from layout_generation import get_layout_template, prepare_comic_panels, render_comic_strip
+from texture import apply_texture_to_image, warm_texture_cache
+from worker_pool import comic_pool, prep_pool
+
+RENDER_PROCESSES = int(os.environ.get("COMIC_RENDER_PROCESSES", str(min(4, os.cpu_count() or 1))))  # 0 = threads only
+# fork is cheap and skips re-importing the server in every worker; it is safe because the pool
+# is started before any other thread exists (see RenderPool.start)
+RENDER_START_METHOD = os.environ.get("COMIC_RENDER_START_METHOD", "fork" if os.name == "posix" else "spawn")
+RENDER_START_TIMEOUT_S = int(os.environ.get("COMIC_RENDER_START_TIMEOUT_S", "60"))  # give up on processes after this
+
+
+def render_strip(panel_images, story, output):
+    """
+    Lay out, texture and encode one comic strip.
+
+    Args:
+        panel_images (list): Panels as PIL images.
+        story (dict): Title and captions.
+        output (dict): encode_image settings.
+
+    Returns:
+        tuple: (encoded bytes, MIME type, {stage: seconds})
+    """
+    timings = {}
+    started = time.perf_counter()
+    prepared = prepare_comic_panels(panel_images)
+    timings["layout_prep"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    strip = render_comic_strip(prepared, story)
+    timings["layout"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    final_comic = apply_texture_to_image(strip)
+    timings["texture"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    data, mime_type = encode_image(final_comic, **output)
+    timings["encode"] = time.perf_counter() - started
+    return data, mime_type, timings
+
+
+class PreparedPanels:
+    """
+    Panels resized to the strip layout, plus their shared memory copy when the
+    render processes are in use. Made by RenderPool.prepare, closed by RenderPool.render.
+    """
+
+    def __init__(self, panels, block=None, layout=None, seconds=0.0):
+        self.panels = panels
+        self.block = block
+        self.layout = layout
+        self.seconds = seconds
+
+    def close(self):
+        """Release the shared memory block, if any."""
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+def prepare_panels(panel_images, shared):
+    """Resize the panels to the layout and, if shared, copy them into shared memory."""
+    started = time.perf_counter()
+    panels = prepare_comic_panels(panel_images)
+    if shared:
+        block, layout = share_panels(panels)
+    else:
+        # Rendering on threads: load the texture layer here rather than in the render
+        warm_texture_cache(get_layout_template(len(panels)).size)
+        block, layout = None, None
+    return PreparedPanels(panels, block, layout, time.perf_counter() - started)
+
+
+def share_panels(panel_images):
+    """
+    Copy the panels' pixels into one shared memory block.
+
+    Returns:
+        tuple: (SharedMemory, [(mode, size, offset, length), ...]). The caller unlinks the block.
+    """
+    panels = [p if p.mode in ("RGB", "RGBA") else p.convert("RGB") for p in panel_images]
+    layout = []
+    total = 0
+    for panel in panels:
+        length = panel.width * panel.height * len(panel.getbands())
+        layout.append((panel.mode, panel.size, total, length))
+        total += length
+    block = shared_memory.SharedMemory(create=True, size=max(total, 1))
+    for panel, (_, _, offset, length) in zip(panels, layout):
+        block.buf[offset:offset + length] = panel.tobytes()
+    return block, layout
+
+
+def _render_shared(block_name, layout, story, output):
+    """Worker side of RenderPool: rebuild the panels from shared memory and render."""
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        panels = []
+        for mode, size, offset, length in layout:
+            view = block.buf[offset:offset + length]
+            panels.append(Image.frombytes(mode, size, view))
+            view.release()
+    finally:
+        block.close()
+    return render_strip(panels, story, output)
+
+
+def _warm_worker():
+    """Process initializer: load fonts, the default canvas and texture layer once per worker."""
+    warm_texture_cache(get_layout_template().size)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    Runs render_strip in worker processes so rendering scales with cores and never
+    holds the event loop's GIL. Panels reach the workers through shared memory; only
+    the small story/settings dicts and the encoded result are pickled. prepare() does
+    the resize and the copy up front, so it can overlap the story call.
+
+    Falls back to the comic thread pool when processes are disabled
+    (COMIC_RENDER_PROCESSES=0), cannot be started, or die.
+
+    Args:
+        processes (int): Worker processes, 0 to always render on threads.
+        start_method (str): multiprocessing start method.
+    """
+
+    def __init__(self, processes=RENDER_PROCESSES, start_method=RENDER_START_METHOD):
+        self.processes = processes
+        self.start_method = start_method
+        self._executor = None
+        self._fallback_reason = None if processes > 0 else "disabled"
+        self._lock = threading.Lock()
+        self.process_renders = 0
+        self.thread_renders = 0
+
+    def start(self, from_thread=False):
+        """
+        Start and warm up the worker processes. Call it early, before other threads
+        exist, when using fork. Otherwise the first render starts the pool with
+        from_thread=True, which uses spawn instead of fork: a child forked from a
+        threaded process can inherit locks held by other threads and hang.
+        """
+        with self._lock:
+            if self._executor is not None or self._fallback_reason is not None:
+                return
+            start_method = "spawn" if from_thread and self.start_method == "fork" else self.start_method
+            executor = None
+            try:
+                # Workers must share our resource tracker, or each one would report the
+                # shared memory blocks it attached to as leaked
+                resource_tracker.ensure_running()
+                executor = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    mp_context=multiprocessing.get_context(start_method),
+                    initializer=_warm_worker,
+                )
+                # Make every worker start (and run the initializer) now, not on the first request
+                list(executor.map(_ready, range(self.processes), timeout=RENDER_START_TIMEOUT_S))
+            except Exception as e:
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                self._fallback_reason = repr(e)
+                print(f"Render processes unavailable, rendering on threads: {e!r}")
+                return
+            self._executor = executor
+
+    def _fall_back(self, reason):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._fallback_reason = reason
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+        print(f"Render processes stopped, rendering on threads from now on: {reason}")
+
+    async def prepare(self, panel_images):
+        """
+        Resize the panels to the layout, and copy them into shared memory when rendering
+        on processes, ahead of render(). Returns PreparedPanels.
+        """
+        if self._executor is None and self._fallback_reason is None:
+            await asyncio.to_thread(self.start, from_thread=True)
+        return await prep_pool.run(prepare_panels, panel_images, self._executor is not None)
+
+    async def render(self, panels, story, output):
+        """
+        Render a comic strip off the event loop.
+
+        Args:
+            panels: Panels as PIL images, or PreparedPanels from prepare() (closed here).
+            story (dict): Title and captions.
+            output (dict): encode_image settings.
+
+        Returns:
+            tuple: (encoded bytes, MIME type, {stage: seconds})
+        """
+        prepared = panels if isinstance(panels, PreparedPanels) else await self.prepare(panels)
+        try:
+            executor = self._executor
+            if executor is not None and prepared.block is not None:
+                try:
+                    data, mime_type, timings = await asyncio.get_running_loop().run_in_executor(
+                        executor, _render_shared, prepared.block.name, prepared.layout, story, output
+                    )
+                    self.process_renders += 1
+                    return data, mime_type, {**timings, "layout_prep": prepared.seconds}
+                except BrokenProcessPool as e:
+                    self._fall_back(repr(e))
+
+            data, mime_type, timings = await comic_pool.run(render_strip, prepared.panels, story, output)
+            self.thread_renders += 1
+            return data, mime_type, {**timings, "layout_prep": prepared.seconds}
+        finally:
+            prepared.close()
+
+    def stats(self):
+        return {
+            "processes": self.processes if self._executor is not None else 0,
+            "process_renders": self.process_renders,
+            "thread_renders": self.thread_renders,
+            "fallback": self._fallback_reason,
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+render_pool = RenderPool()
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+
+CACHE_MAX_ENTRIES = int(os.environ.get("COMIC_CACHE_MAX_ENTRIES", "32"))
+CACHE_MAX_MB = int(os.environ.get("COMIC_CACHE_MAX_MB", "256"))
+CACHE_DIR = os.environ.get("COMIC_CACHE_DIR")  # unset = memory tier only
+CACHE_TTL = int(os.environ.get("COMIC_CACHE_TTL", str(24 * 3600)))
+
+
+def _entry_size(result):
+    """Approximate memory held by a cached result, in bytes."""
+    size = len(result["final_image"])
+    for panel in result["panels"]:
+        size += panel.width * panel.height * len(panel.getbands())
+    return size
+
+
+class ComicResultCache:
+    """
+    Content-addressed cache of finished comics.
+
+    A result is a dict with 'panels' (list of PIL images), 'story' (dict),
+    'final_image' (encoded bytes) and 'mime_type'. The memory tier is an LRU
+    bounded by entry count and total size; the optional disk tier keeps one
+    directory per key and drops entries older than the TTL.
+
+    Args:
+        max_entries (int): Maximum results kept in memory.
+        max_bytes (int): Maximum approximate memory used by cached results.
+        disk_dir (str): Directory for the disk tier, or None to disable it.
+        ttl (int): Seconds a disk entry stays valid.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_MB * 1024 * 1024,
+                 disk_dir=CACHE_DIR, ttl=CACHE_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(image_bytes, reference_bytes=None, **params):
+        """Hash the decoded input image bytes plus the generation parameters."""
+        digest = hashlib.sha256()
+        digest.update(image_bytes)
+        digest.update(b"\0")
+        digest.update(reference_bytes or b"default-style")
+        digest.update(b"\0")
+        digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    async def get(self, key):
+        with self._lock:
+            result = self._memory.get(key)
+            if result is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return result
+
+        if self.disk_dir:
+            result = await asyncio.to_thread(self._read_disk, key)
+            if result is not None:
+                self.disk_hits += 1
+                self._remember(key, result)
+                return result
+
+        self.misses += 1
+        return None
+
+    async def put(self, key, result):
+        self._remember(key, result)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_mb": round(self._memory_bytes / (1024 * 1024), 1),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+    # --- Memory tier ---
+    def _remember(self, key, result):
+        size = _entry_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_bytes -= _entry_size(self._memory.pop(key))
+            self._memory[key] = result
+            self._memory_bytes += size
+            while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= _entry_size(evicted)
+
+    # --- Disk tier ---
+    def _read_disk(self, key):
+        entry_dir = os.path.join(self.disk_dir, key)
+        story_path = os.path.join(entry_dir, "story.json")
+        try:
+            if time.time() - os.path.getmtime(story_path) > self.ttl:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return None
+            with open(story_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            panels = []
+            for i in range(meta["panel_count"]):
+                panel = Image.open(os.path.join(entry_dir, f"comic_panel_{i + 1}.png"))
+                panel.load()
+                panels.append(panel)
+            with open(os.path.join(entry_dir, "final_comic"), "rb") as f:
+                final_image = f.read()
+        except (OSError, ValueError, KeyError):
+            return None
+        return {"panels": panels, "story": meta["story"], "final_image": final_image, "mime_type": meta["mime_type"]}
+
+    def _write_disk(self, key, result):
+        self._evict_expired()
+        entry_dir = os.path.join(self.disk_dir, key)
+        staging_dir = tempfile.mkdtemp(dir=self.disk_dir, prefix=".staging-")
+        try:
+            for i, panel in enumerate(result["panels"]):
+                panel.save(os.path.join(staging_dir, f"comic_panel_{i + 1}.png"))
+            with open(os.path.join(staging_dir, "final_comic"), "wb") as f:
+                f.write(result["final_image"])
+            # story.json is written last: its presence and mtime mark a complete entry
+            with open(os.path.join(staging_dir, "story.json"), "w", encoding="utf-8") as f:
+                json.dump({
+                    "story": result["story"],
+                    "panel_count": len(result["panels"]),
+                    "mime_type": result["mime_type"],
+                }, f)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(staging_dir, entry_dir)
+        except OSError as e:
+            print(f"Failed to write comic cache entry {key}: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def _evict_expired(self):
+        now = time.time()
+        for name in os.listdir(self.disk_dir):
+            entry_dir = os.path.join(self.disk_dir, name)
+            try:
+                if now - os.path.getmtime(entry_dir) > self.ttl:
+                    shutil.rmtree(entry_dir, ignore_errors=True)
+            except OSError:
+                continue
+
+
+result_cache = ComicResultCache()
@@ -0,0 +1,180 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from google.genai import types
+from PIL import Image
+
+from clients import get_genai_client
+
+STYLES_DIR = os.environ.get("COMIC_STYLES_DIR")  # extra named styles: one image per style, named by file stem
+STYLE_MAX_SIDE = int(os.environ.get("COMIC_STYLE_MAX_SIDE", "1024"))
+STYLE_UPLOAD = os.environ.get("COMIC_STYLE_UPLOAD", "1") != "0"  # 0 = always send styles inline
+UPLOADED_STYLE_CACHE_SIZE = int(os.environ.get("COMIC_STYLE_CACHE_SIZE", "16"))
+STYLE_UPLOAD_TIMEOUT_S = float(os.environ.get("COMIC_STYLE_UPLOAD_TIMEOUT_S", "15"))  # longest a File API upload may take
+
+DEFAULT_STYLE_PATH = os.path.join(os.path.dirname(__file__), "Test_Images", "StyleReference.jpg")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+FILE_REFRESH_MARGIN = timedelta(hours=1)  # re-upload a file this close to its expiry
+UPLOAD_RETRY_S = 300  # after a failed upload, send inline for this long before trying again
+
+
+class ComicStyle:
+    """
+    A style reference image, resized and JPEG-encoded once.
+
+    Registered styles (upload=True) are uploaded through the Gemini File API on first
+    use so requests can reference them by URI instead of carrying the bytes. Other
+    styles, and registered ones whose upload is disabled, failed, timed out or is still
+    in progress on another thread, are sent inline.
+
+    Args:
+        name (str): Style name, also used in the result cache key.
+        image (PIL.Image): The reference image.
+        upload (bool): Whether the style may be uploaded to the File API.
+    """
+
+    def __init__(self, name, image, upload=False):
+        self.name = name
+        self.upload = upload
+        image = image.convert("RGB")
+        image.thumbnail((STYLE_MAX_SIDE, STYLE_MAX_SIDE), Image.LANCZOS)
+        buf = io.BytesIO()
+        image.save(buf, format="JPEG", quality=90)
+        self.data = buf.getvalue()
+        self._file = None
+        self._retry_upload_at = 0.0
+        self._lock = threading.Lock()
+
+    def part(self, deadline=None):
+        """
+        Content part for generate_content: a File API reference when available, else the inline JPEG.
+
+        Args:
+            deadline (float): Optional time.monotonic() deadline; an upload never runs past it
+                (nor past STYLE_UPLOAD_TIMEOUT_S).
+        """
+        file = self._uploaded_file(deadline) if self.upload and STYLE_UPLOAD else None
+        if file is not None:
+            return types.Part.from_uri(file_uri=file.uri, mime_type=file.mime_type or "image/jpeg")
+        return types.Part.from_bytes(data=self.data, mime_type="image/jpeg")
+
+    def _uploaded_file(self, deadline):
+        # Only one thread uploads; the others send the style inline meanwhile instead of waiting
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            if self._file is not None and not _expiring(self._file):
+                return self._file
+            if time.monotonic() < self._retry_upload_at:
+                return None
+            timeout = STYLE_UPLOAD_TIMEOUT_S
+            if deadline is not None:
+                timeout = min(timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                return None
+            files = getattr(get_genai_client(), "files", None)
+            if files is None:
+                self._retry_upload_at = float("inf")
+                return None
+            try:
+                self._file = files.upload(
+                    file=io.BytesIO(self.data),
+                    config=types.UploadFileConfig(
+                        mime_type="image/jpeg",
+                        display_name=f"comic-style-{self.name}",
+                        http_options=types.HttpOptions(timeout=int(timeout * 1000)),
+                    ),
+                )
+            except Exception as e:
+                print(f"Style upload failed for '{self.name}', sending it inline: {e}")
+                self._file = None
+                self._retry_upload_at = time.monotonic() + UPLOAD_RETRY_S
+            return self._file
+        finally:
+            self._lock.release()
+
+
+def _expiring(file):
+    if file.expiration_time is None:
+        return False
+    return file.expiration_time - datetime.now(timezone.utc) < FILE_REFRESH_MARGIN
+
+
+class StyleRegistry:
+    """
+    Named comic styles, loaded once, plus a small LRU of styles built from uploaded references.
+
+    The bundled Test_Images/StyleReference.jpg is registered as 'default'; every image in
+    COMIC_STYLES_DIR is registered under its lower-cased file name without extension.
+    """
+
+    def __init__(self, styles_dir=STYLES_DIR, default_path=DEFAULT_STYLE_PATH, max_uploaded=UPLOADED_STYLE_CACHE_SIZE):
+        self.styles_dir = styles_dir
+        self.default_path = default_path
+        self.max_uploaded = max_uploaded
+        self._named = None
+        self._uploaded = OrderedDict()  # sha256 of the upload -> ComicStyle
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the named styles. Only the first call does any work."""
+        with self._lock:
+            if self._named is not None:
+                return
+            paths = {}
+            if os.path.exists(self.default_path):
+                paths["default"] = self.default_path
+            if self.styles_dir and os.path.isdir(self.styles_dir):
+                for file_name in sorted(os.listdir(self.styles_dir)):
+                    stem, ext = os.path.splitext(file_name)
+                    if ext.lower() in IMAGE_EXTENSIONS:
+                        paths[stem.lower()] = os.path.join(self.styles_dir, file_name)
+            named = {}
+            for name, path in paths.items():
+                try:
+                    with Image.open(path) as image:
+                        named[name] = ComicStyle(name, image, upload=True)
+                except OSError as e:
+                    print(f"Skipping style '{name}' ({path}): {e}")
+            self._named = named
+
+    def warm(self):
+        """Load the named styles and upload them ahead of the first request."""
+        self.load()
+        for style in self._named.values():
+            style.part()
+
+    def names(self):
+        self.load()
+        return sorted(self._named)
+
+    def get(self, style_id):
+        """Registered style by name, or None."""
+        self.load()
+        return self._named.get(style_id.lower())
+
+    def from_upload(self, image_bytes, image):
+        """
+        Style for a user-supplied reference, reused while the same bytes keep coming in.
+        It is always sent inline: one-off images, often user photos, are not stored in Gemini Files.
+        """
+        key = hashlib.sha256(image_bytes).hexdigest()
+        with self._lock:
+            style = self._uploaded.get(key)
+            if style is not None:
+                self._uploaded.move_to_end(key)
+                return style
+        style = ComicStyle(f"upload-{key[:16]}", image)
+        with self._lock:
+            self._uploaded[key] = style
+            while len(self._uploaded) > self.max_uploaded:
+                self._uploaded.popitem(last=False)
+        return style
+
+
+style_registry = StyleRegistry()
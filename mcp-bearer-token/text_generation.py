@@ -1,13 +1,40 @@
 from PIL import Image
-from google import genai
-from dotenv import load_dotenv
-import os
+from google.genai import types
+from clients import get_genai_client
+from gemini_retry import call_with_retry, remaining_ms
 import json
 import re
 
-load_dotenv()
-KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=KEY)
+STORY_FORMAT_PROMPT = """Just give one line narrating the scene for each image THE STORY SHOULD BE CONSISTENT OVER THE THREE IMAGES
+I need the response in the following format: ONLY THE JSON NOTHING ELSE IN RESPONSE(start with { and end with })
+{title:"", text1:"", text2:"",text3:""}
+Example Response: 
+{
+  "title": "The Unexpected Curry",
+  "text1": "Gopal discovers the curry his wife made is surprisingly spicy.",
+  "text2": "He realizes the overwhelming heat might be more than he bargained for.",
+  "text3": "But Gopal, ever the comedian, decides to embrace the heat and declare this the spiciest curry champion!"
+}
+CREATE WACKY FUNNY AND QUIRKY STORIES, KEEP THE LINES SHORT(less than 20 words each). 
+"""
+
+STORY_KEYS = ("title", "text1", "text2", "text3")
+
+# Constrains the story calls to the JSON shape above
+STORY_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={key: types.Schema(type=types.Type.STRING) for key in STORY_KEYS},
+    required=list(STORY_KEYS),
+    property_ordering=list(STORY_KEYS),
+)
+
+
+def story_config(deadline):
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=STORY_SCHEMA,
+        http_options=types.HttpOptions(timeout=remaining_ms(deadline)),
+    )
 
 def generate_comic_story(image_paths, name):
     """
@@ -23,27 +50,64 @@ def generate_comic_story(image_paths, name):
         raise ValueError("You must provide exactly 3 image paths.")
 
     images = [Image.open(path) for path in image_paths]
+    return generate_comic_story_from_images(images, name)
 
-    prompt =  """Create a 3-panel comic story based on these images. 
-Just give one line narrating the scene for each image THE STORY SHOULD BE CONSISTENT OVER THE THREE IMAGES
-I need the response in the following format: ONLY THE JSON NOTHING ELSE IN RESPONSE(start with { and end with })
-{title:"", text1:"", text2:"",text3:""}
-Example Response: 
-{
-  "title": "The Unexpected Curry",
-  "text1": "Gopal discovers the curry his wife made is surprisingly spicy.",
-  "text2": "He realizes the overwhelming heat might be more than he bargained for.",
-  "text3": "But Gopal, ever the comedian, decides to embrace the heat and declare this the spiciest curry champion!"
-}
-CREATE WACKY FUNNY AND QUIRKY STORIES, KEEP THE LINES SHORT(less than 20 words each). 
-""" + f"The character's name is {name}"
 
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=images + [prompt]
+def generate_comic_story_from_images(images, name, deadline=None):
+    """
+    Generate a funny 3-panel comic story from 3 in-memory panel images.
+
+    Args:
+        images (list of PIL.Image): The 3 comic panels.
+
+    Returns:
+        dict: A dictionary with 'title', 'text1', 'text2', and 'text3' keys.
+    """
+    if len(images) != 3:
+        raise ValueError("You must provide exactly 3 images.")
+
+    prompt = "Create a 3-panel comic story based on these images. \n" + STORY_FORMAT_PROMPT + f"The character's name is {name}"
+
+    client = get_genai_client()
+    response = call_with_retry(
+        lambda: client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=images + [prompt],
+            config=story_config(deadline),
+        ),
+        deadline=deadline,
+    )
+    return parse_story_json(response.text)
+
+
+def generate_comic_story_from_guide(story_guide, name, deadline=None):
+    """
+    Generate a funny 3-panel comic story from the user's story guide alone, without
+    the panel images. Used to run the story call in parallel with panel generation.
+
+    Returns:
+        dict: A dictionary with 'title', 'text1', 'text2', and 'text3' keys.
+    """
+    prompt = (
+        "Create a 3-panel comic story for this story guide: " + story_guide + "\n"
+        + STORY_FORMAT_PROMPT + f"The character's name is {name}"
+    )
+
+    client = get_genai_client()
+    response = call_with_retry(
+        lambda: client.models.generate_content(
+            model="gemini-2.0-flash",
+            contents=[prompt],
+            config=story_config(deadline),
+        ),
+        deadline=deadline,
     )
+    return parse_story_json(response.text)
+
 
-    story_json = response.text.strip()
+def parse_story_json(text):
+    """Parse the story dict out of a Gemini text response."""
+    story_json = text.strip()
 
     # Remove triple backticks and "json" language hint
     story_json = re.sub(r"^```json\s*|\s*```$", "", story_json.strip(), flags=re.MULTILINE)
@@ -53,3 +117,22 @@ CREATE WACKY FUNNY AND QUIRKY STORIES, KEEP THE LINES SHORT(less than 20 words e
         return story_dict
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse Gemini output: {e}\nCleaned output was:\n{story_json}")
+
+
+def find_story_json(text):
+    """
+    Find the story dict in free-form model text, e.g. the text parts that come with
+    generated images. Returns the first JSON object holding a string title and
+    text1..text3, or None if there is none.
+    """
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            candidate, _ = decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            candidate = None
+        if isinstance(candidate, dict) and all(isinstance(candidate.get(key), str) for key in STORY_KEYS):
+            return {key: candidate[key] for key in STORY_KEYS}
+        start = text.find("{", start + 1)
+    return None
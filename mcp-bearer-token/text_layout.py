@@ -0,0 +1,165 @@
+from PIL import ImageFont
+from functools import lru_cache
+
+ELLIPSIS = "..."
+WORD_CACHE_SIZE = 4096  # measured words kept per font and size before the cache is reset
+FIT_CACHE_SIZE = 512
+
+
+@lru_cache(maxsize=None)
+def load_font(path, size):
+    """Load a TrueType/OpenType font once per (path, size), falling back to the default font."""
+    try:
+        return ImageFont.truetype(path, size)
+    except Exception as e:
+        print(f"Error loading font {path}: {e}. Falling back to default font.")
+        return ImageFont.load_default()
+
+
+class FontMetrics:
+    """
+    Advance widths for one font at one size, measured once per word and per glyph.
+
+    Lines are measured as the sum of their words plus the spaces between them, so
+    wrapping and centering never ask the font to lay out a whole line.
+    """
+
+    def __init__(self, path, size):
+        self.size = size
+        self.font = load_font(path, size)
+        try:
+            ascent, descent = self.font.getmetrics()
+        except AttributeError:  # bitmap fallback font
+            ascent, descent = self.font.getbbox("Ag")[3], 0
+        self.line_height = ascent + descent
+        self.space = self.font.getlength(" ")
+        self._words = {}
+        self._glyphs = {}
+
+    def word_width(self, word):
+        width = self._words.get(word)
+        if width is None:
+            if len(self._words) >= WORD_CACHE_SIZE:
+                self._words.clear()
+            width = self._words[word] = self.font.getlength(word)
+        return width
+
+    def glyph_width(self, glyph):
+        width = self._glyphs.get(glyph)
+        if width is None:
+            width = self._glyphs[glyph] = self.font.getlength(glyph)
+        return width
+
+    def _split_word(self, word, max_width):
+        """Break a word wider than max_width into pieces that fit, by glyph advances."""
+        pieces, piece, width = [], "", 0
+        for glyph in word:
+            glyph_width = self.glyph_width(glyph)
+            if piece and width + glyph_width > max_width:
+                pieces.append(piece)
+                piece, width = "", 0
+            piece += glyph
+            width += glyph_width
+        pieces.append(piece)
+        return pieces
+
+    def wrap(self, text, max_width):
+        """Greedily wrap text to max_width pixels. Returns [(line, width), ...]."""
+        lines, words, width = [], [], 0
+        for word in text.split():
+            pieces = [word] if self.word_width(word) <= max_width else self._split_word(word, max_width)
+            for piece in pieces:
+                piece_width = self.word_width(piece)
+                if words and width + self.space + piece_width > max_width:
+                    lines.append((" ".join(words), width))
+                    words, width = [], 0
+                width += piece_width + (self.space if words else 0)
+                words.append(piece)
+        if words:
+            lines.append((" ".join(words), width))
+        return lines
+
+    def block_height(self, line_count, spacing):
+        return line_count * self.line_height + max(0, line_count - 1) * spacing
+
+    def ellipsize(self, line, max_width):
+        """Shorten a line until it fits max_width with an ellipsis appended."""
+        budget = max_width - self.word_width(ELLIPSIS)
+        width = self.word_width(line)
+        while line and width > budget:
+            line = line[:-1].rstrip()
+            width = self.word_width(line)
+        return line + ELLIPSIS, width + self.word_width(ELLIPSIS)
+
+
+@lru_cache(maxsize=None)
+def font_metrics(path, size):
+    """Shared FontMetrics for a font file at a size."""
+    return FontMetrics(path, size)
+
+
+class TextBlock:
+    """Wrapped lines set in one font, ready to draw centered in a box."""
+
+    def __init__(self, metrics, lines, spacing):
+        self.metrics = metrics
+        self.lines = lines
+        self.spacing = spacing
+
+    @property
+    def font(self):
+        return self.metrics.font
+
+    @property
+    def height(self):
+        return self.metrics.block_height(len(self.lines), self.spacing)
+
+    def draw(self, draw, x, y, width, fill="black"):
+        """Draw the lines from the top of the box at (x, y), each centered in width."""
+        step = self.metrics.line_height + self.spacing
+        for i, (line, line_width) in enumerate(self.lines):
+            draw.text((x + (width - line_width) // 2, y + i * step), line, fill=fill, font=self.metrics.font)
+
+
+@lru_cache(maxsize=FIT_CACHE_SIZE)
+def fit_text(text, font_path, max_width, max_height, max_size, min_size, spacing=5):
+    """
+    Wrap text in the largest font size between min_size and max_size that fits the box.
+
+    Sizes are found by binary search; each probe wraps with that size's cached word
+    widths. If the text does not fit even at min_size, it is cut to the lines that do
+    and the last one ends with an ellipsis, so the block never overflows the box
+    (unless the box is shorter than a single line).
+
+    Args:
+        text (str): The caption or title.
+        font_path (str): Font file.
+        max_width (int): Box width in pixels.
+        max_height (int): Box height in pixels.
+        max_size (int): Preferred (largest) font size.
+        min_size (int): Smallest font size to try.
+        spacing (int): Pixels between lines.
+
+    Returns:
+        TextBlock: The fitted lines and font.
+    """
+    low, high = min_size, max(min_size, max_size)
+    best = None
+    while low <= high:
+        size = (low + high) // 2
+        metrics = font_metrics(font_path, size)
+        lines = metrics.wrap(text, max_width)
+        if metrics.block_height(len(lines), spacing) <= max_height:
+            best = TextBlock(metrics, lines, spacing)
+            low = size + 1
+        else:
+            high = size - 1
+    if best is not None:
+        return best
+
+    metrics = font_metrics(font_path, min_size)
+    lines = metrics.wrap(text, max_width)
+    keep = max(1, (max_height + spacing) // (metrics.line_height + spacing))
+    lines = lines[:keep]
+    lines[-1] = metrics.ellipsize(lines[-1][0], max_width)
+    return TextBlock(metrics, lines, spacing)
@@ -1,28 +1,159 @@
 from PIL import Image
+from functools import lru_cache
+import threading
 import os
 
+import numpy as np
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-texture = os.path.join(BASE_DIR, "Textures", "Paper_texture.png")
+texture = os.path.join(BASE_DIR, "Textures", "Texturelabs_Paper_313S.jpg")  # paper grain
+specks = os.path.join(BASE_DIR, "Textures", "Texturelabs_Paper_356S.jpg")  # white dust on black
+
+# Paper grain brightens and roughens the strip, the dust layer only lightens it
+DEFAULT_TEXTURES = [(texture, "overlay", 0.6), (specks, "screen", 0.35)]
+
+TEXTURE_OPACITY = 0.7
+TEXTURE_CACHE_SIZE = int(os.environ.get("TEXTURE_CACHE_SIZE", "8"))
+
+BLEND_MODES = ("normal", "multiply", "screen", "overlay")
 
-def apply_texture_overlay(base_image_path, texture_paths=[texture], output_path="textured_comic.png", blend_mode="normal"):
+def apply_texture_overlay(base_image_path, texture_paths=DEFAULT_TEXTURES, output_path="textured_comic.png", blend_mode="normal"):
     # Open comic strip
-    base = Image.open(base_image_path).convert("RGBA")
+    base = Image.open(base_image_path)
+    apply_texture_to_image(base, texture_paths, blend_mode).save(output_path)
+    #print(f"Saved textured image at {output_path}")
+
 
-    for texture_path in texture_paths:
-        texture = Image.open(texture_path).convert("RGBA")
-        texture = texture.resize(base.size)
+def _div255(values, scratch):
+    """Round values / 255 in place for uint16 values up to 255 * 255, without leaving uint16."""
+    values += 128
+    np.right_shift(values, 8, out=scratch)
+    values += scratch
+    values >>= 8
 
-        # Optional: reduce texture opacity
-        alpha = texture.split()[3]
-        alpha = alpha.point(lambda p: p * 0.7)  # 40% opacity
-        texture.putalpha(alpha)
 
-        # Blend based on mode
-        if blend_mode == "multiply":
-            base = Image.blend(base, texture, alpha=0.2)
+def _layer_specs(texture_paths, blend_mode):
+    """Normalize texture entries to (path, blend mode, opacity) tuples."""
+    specs = []
+    for entry in texture_paths:
+        if isinstance(entry, (tuple, list)):
+            path, mode, opacity = (*entry, TEXTURE_OPACITY)[:3]
         else:
-            base = Image.alpha_composite(base, texture)
+            path, mode, opacity = entry, blend_mode, TEXTURE_OPACITY
+        if mode not in BLEND_MODES:
+            raise ValueError(f"Unknown blend mode '{mode}', expected one of {', '.join(BLEND_MODES)}")
+        specs.append((path, mode, float(opacity)))
+    return specs
 
-    base.convert("RGB").save(output_path)
-    #print(f"Saved textured image at {output_path}")
 
+@lru_cache(maxsize=TEXTURE_CACHE_SIZE)
+def load_texture_layer(texture_path, size, opacity=TEXTURE_OPACITY, blend_mode="normal"):
+    """
+    Load a texture resized to `size` and precompute its blend factors.
+
+    With the layer's alpha a (texture alpha times opacity) and colour t, compositing
+    each mode over the base b reduces to one multiplication per pixel:
+
+        normal:    (b * (255 - a) + t * a) / 255
+        multiply:  b * gain / 255,               gain = 255 - a + a * t / 255
+        screen:    255 - (255 - b) * gain / 255,  gain = 255 - a * (255 - t) / 255
+        overlay:   multiply by 2t where b < 128, screen by 2t - 255 elsewhere
+
+    The result is cached per (texture path, size, opacity, blend mode), so repeated
+    strips of the same size only pay for the blend. Treat it as read-only.
+
+    Returns:
+        tuple: The blend mode followed by its uint16 factor arrays.
+    """
+    layer = Image.open(texture_path).convert("RGBA")
+    layer = layer.resize(size)
+
+    pixels = np.asarray(layer, dtype=np.int32)
+    alpha = (pixels[..., 3:] * round(opacity * 255) + 127) // 255
+    colour = pixels[..., :3]
+
+    def gain(values):
+        return (255 - alpha + (alpha * values + 127) // 255).astype(np.uint16)
+
+    if blend_mode == "normal":
+        return ("normal", (255 - alpha).astype(np.uint16), (alpha * colour).astype(np.uint16))
+    if blend_mode == "multiply":
+        return ("multiply", gain(colour))
+    if blend_mode == "screen":
+        return ("screen", gain(255 - colour))
+    return ("overlay", gain(2 * colour), gain(2 * (255 - colour)))
+
+
+def warm_texture_cache(size, texture_paths=DEFAULT_TEXTURES, blend_mode="normal"):
+    """Preload texture layers for a strip size, e.g. at server start. Raises if a texture is missing."""
+    for texture_path, mode, opacity in _layer_specs(texture_paths, blend_mode):
+        load_texture_layer(texture_path, tuple(size), opacity, mode)
+
+
+_buffers = threading.local()
+
+
+def _work_buffers(shape):
+    """Per-thread work buffers for a strip shape, reused across calls."""
+    buffers = getattr(_buffers, "by_shape", None)
+    if buffers is None or buffers[0] != shape:
+        buffers = (shape, np.empty(shape, np.uint16), np.empty(shape, np.uint16),
+                   np.empty(shape, np.uint16), np.empty(shape, np.bool_))
+        _buffers.by_shape = buffers
+    return buffers[1:]
+
+
+def apply_texture_to_image(base, texture_paths=DEFAULT_TEXTURES, blend_mode="normal"):
+    """
+    Return an RGB copy of the comic strip image with the textures applied.
+
+    All layers are blended in order into one uint16 working copy of the strip, using
+    the factors precomputed by load_texture_layer, and converted back to PIL once.
+
+    Args:
+        base (PIL.Image): The comic strip.
+        texture_paths (list): Texture file paths, or (path, blend mode[, opacity]) tuples
+            to give a layer its own mode and opacity.
+        blend_mode (str): Mode for plain paths: normal, multiply, screen or overlay.
+
+    Raises:
+        FileNotFoundError: If a texture file is missing.
+    """
+    layers = [
+        load_texture_layer(texture_path, base.size, opacity, mode)
+        for texture_path, mode, opacity in _layer_specs(texture_paths, blend_mode)
+    ]
+    if not layers:
+        return base.convert("RGB")
+
+    pixels = np.asarray(base.convert("RGB"))
+    out, other, scratch, dark = _work_buffers(pixels.shape)
+    np.copyto(out, pixels)
+
+    # Every product below stays within 255 * 255, so uint16 never overflows
+    for mode, *factors in layers:
+        if mode == "normal":
+            out *= factors[0]
+            out += factors[1]
+            _div255(out, scratch)
+        elif mode == "multiply":
+            out *= factors[0]
+            _div255(out, scratch)
+        elif mode == "screen":
+            np.subtract(255, out, out=out)
+            out *= factors[0]
+            _div255(out, scratch)
+            np.subtract(255, out, out=out)
+        else:
+            # Both halves are computed for every pixel and the right one kept; the
+            # discarded half may wrap around, which is harmless
+            np.less(out, 128, out=dark)
+            np.subtract(255, out, out=other)
+            other *= factors[1]
+            _div255(other, scratch)
+            np.subtract(255, other, out=other)
+            out *= factors[0]
+            _div255(out, scratch)
+            np.copyto(out, other, where=~dark)
+
+    return Image.fromarray(out.astype(np.uint8), "RGB")
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_WORKERS = int(os.environ.get("COMIC_MAX_WORKERS", "4"))
+PREP_WORKERS = int(os.environ.get("COMIC_PREP_WORKERS", "2"))  # threads for decode/prep, apart from the Gemini calls
+
+
+class WorkerPool:
+    """
+    Runs blocking calls (Gemini requests, PIL work) on a dedicated thread pool
+    so the event loop stays free, with a fixed concurrency limit.
+
+    Args:
+        max_workers (int): Maximum number of calls running at the same time.
+        name (str): Thread name prefix, handy when reading stack dumps.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, name="comic-worker"):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self._queued += 1
+
+        def call():
+            waited = time.perf_counter() - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait += waited
+                self._max_wait = max(self._max_wait, waited)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+
+        def forget_cancelled(future):
+            # A job cancelled while still queued never reaches call()
+            if future.cancelled():
+                with self._lock:
+                    self._queued -= 1
+
+        future = self._executor.submit(call)
+        future.add_done_callback(forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        """Return queue depth and wait-time figures for reporting."""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "avg_wait_s": round(self._total_wait / started, 3) if started else 0.0,
+                "max_wait_s": round(self._max_wait, 3),
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+comic_pool = WorkerPool()
+prep_pool = WorkerPool(max_workers=PREP_WORKERS, name="comic-prep")